@@ -0,0 +1,195 @@
+import argparse
+import json
+import logging
+import os
+import sys
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+from core import instrument
+from core.bootstrap import bootstrap
+from core.db import unit_of_work
+from services.base import QuoteInputError
+from services.engine import cftv_dynamic, composite_quote, concertina_plan, quote, quote_many
+from services.registry import SERVICE_REGISTRY
+
+# API JSON de orçamento (bots de WhatsApp, jobs em lote), sem Streamlit.
+#   GET  /health
+#   GET  /services
+#   POST /quote        {"service_id": "cerca", "inputs": {...}, "at": "2026-01-31T12:00:00-03:00"}  (at opcional)
+#                      {"services": [{"service_id": ..., "inputs": {...}}, ...]}
+#   POST /quote/cftv   {"quantities": {"cftv_camera_bullet_2mp": 4}}
+#   POST /quote/composite  {"services": [...]}  (lista de materiais consolidada)
+#   POST /quote/concertina-plan  {"segments": [9.5, 12, 9.5, 12], "fios": 6, "espac": 2.5, "closed": true}
+# Autenticação: Authorization: Bearer <token>; QUOTE_API_TOKENS="token1:company_id,token2:company_id"
+
+MAX_BODY = 64 * 1024
+
+log = logging.getLogger(__name__)
+
+def load_tokens() -> Dict[str, int]:
+    tokens = {}
+    for pair in os.getenv("QUOTE_API_TOKENS", "").split(","):
+        token, _, cid = pair.strip().partition(":")
+        if token and cid.isdigit():
+            tokens[token] = int(cid)
+    return tokens
+
+def parse_at(raw: Any) -> Optional[datetime]:
+    # preços vigentes numa data (ISO 8601, com fuso); None = preços atuais
+    if raw in (None, ""):
+        return None
+    try:
+        at = datetime.fromisoformat(str(raw))
+    except ValueError:
+        raise QuoteInputError({"at": "data ISO 8601 inválida"})
+    if at.tzinfo is None:
+        raise QuoteInputError({"at": "informe o fuso horário (ex: -03:00)"})
+    return at
+
+def parse_services(raw: Any) -> List[Tuple[str, Dict[str, Any]]]:
+    # [{"service_id": ..., "inputs": {...}}, ...]; erros por elemento, no mesmo formato do quote_many ("0.campo")
+    if not isinstance(raw, list) or not raw:
+        raise QuoteInputError({"services": "esperado uma lista de objetos"})
+    pairs = []
+    errors = {}
+    for i, r in enumerate(raw):
+        if not isinstance(r, dict):
+            errors[f"{i}"] = "esperado um objeto {service_id, inputs}"
+            continue
+        service_id = r.get("service_id", "")
+        inputs = r.get("inputs") or {}
+        if not isinstance(service_id, str):
+            errors[f"{i}.service_id"] = "esperado um texto"
+        if not isinstance(inputs, dict):
+            errors[f"{i}.inputs"] = "esperado um objeto"
+        pairs.append((service_id, inputs))
+    if errors:
+        raise QuoteInputError(errors)
+    return pairs
+
+class QuoteHandler(BaseHTTPRequestHandler):
+    engine = None
+    tokens: Dict[str, int] = {}
+
+    def _send(self, status: int, payload: Any) -> None:
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _company(self) -> Optional[int]:
+        auth = self.headers.get("Authorization", "")
+        if not auth.startswith("Bearer "):
+            return None
+        return self.tokens.get(auth[len("Bearer "):].strip())
+
+    def _body(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        if length <= 0 or length > MAX_BODY:
+            raise QuoteInputError({"body": f"corpo JSON obrigatório (até {MAX_BODY} bytes)"})
+        try:
+            data = json.loads(self.rfile.read(length))
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            raise QuoteInputError({"body": "JSON inválido"})
+        if not isinstance(data, dict):
+            raise QuoteInputError({"body": "esperado um objeto JSON"})
+        return data
+
+    def do_GET(self) -> None:
+        if self.path == "/health":
+            self._send(200, {"ok": True})
+        elif self.path == "/services":
+            self._send(200, {"services": SERVICE_REGISTRY.labels()})
+        else:
+            self._send(404, {"error": "não encontrado"})
+
+    def do_POST(self) -> None:
+        if self.path not in ("/quote", "/quote/cftv", "/quote/composite", "/quote/concertina-plan"):
+            self._send(404, {"error": "não encontrado"})
+            return
+        company_id = self._company()
+        if company_id is None:
+            self._send(401, {"error": "token inválido"})
+            return
+
+        try:
+            data = self._body()
+            with instrument.track(self.path), unit_of_work(self.engine):
+                if self.path == "/quote/cftv":
+                    quantities = data.get("quantities")
+                    if not isinstance(quantities, dict):
+                        raise QuoteInputError({"quantities": "esperado um objeto {key: quantidade}"})
+                    result = cftv_dynamic(self.engine, company_id, quantities)
+                elif self.path == "/quote/concertina-plan":
+                    result = concertina_plan(self.engine, company_id, data.get("segments"), data.get("fios", 6),
+                                             data.get("espac", 2.5), closed=data.get("closed", True) is not False)
+                elif "services" in data or self.path == "/quote/composite":
+                    pairs = parse_services(data.get("services"))
+                    if self.path == "/quote/composite":
+                        result = composite_quote(self.engine, company_id, pairs, at=parse_at(data.get("at")))
+                    else:
+                        result = {"quotes": quote_many(self.engine, company_id, pairs, at=parse_at(data.get("at")))}
+                else:
+                    inputs = data.get("inputs") or {}
+                    if not isinstance(inputs, dict):
+                        raise QuoteInputError({"inputs": "esperado um objeto"})
+                    result = quote(self.engine, company_id, str(data.get("service_id", "")), inputs, at=parse_at(data.get("at")))
+        except QuoteInputError as e:
+            self._send(422, {"error": "entrada inválida", "fields": e.errors})
+            return
+        except Exception:
+            # bug ou banco fora: o cliente recebe JSON em vez da conexão derrubada
+            log.exception("erro em POST %s (empresa %s)", self.path, company_id)
+            self._send(500, {"error": "erro interno"})
+            return
+        self._send(200, result)
+
+    def log_message(self, fmt: str, *args: Any) -> None:
+        # sem log por requisição no stderr (muito ruído em carga)
+        pass
+
+def serve(host: str, port: int) -> None:
+    QuoteHandler.engine = bootstrap()
+    QuoteHandler.tokens = load_tokens()
+    if not QuoteHandler.tokens:
+        print("aviso: QUOTE_API_TOKENS vazio, todas as requisições de orçamento serão recusadas", file=sys.stderr)
+    httpd = ThreadingHTTPServer((host, port), QuoteHandler)
+    httpd.daemon_threads = True
+    print(f"API de orçamento em http://{host}:{port}")
+    httpd.serve_forever()
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Orçamentos sem Streamlit (API HTTP/JSON ou CLI)")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    s = sub.add_parser("serve", help="sobe a API HTTP")
+    s.add_argument("--host", default=os.getenv("QUOTE_API_HOST", "0.0.0.0"))
+    s.add_argument("--port", type=int, default=int(os.getenv("QUOTE_API_PORT", "8081")))
+
+    q = sub.add_parser("quote", help="calcula um orçamento e imprime o JSON")
+    q.add_argument("--company", type=int, required=True)
+    q.add_argument("--service", required=True)
+    q.add_argument("--inputs", default="{}", help='JSON, ex: {"perimetro": 36, "cantos": 4}')
+
+    args = ap.parse_args()
+    if args.cmd == "serve":
+        serve(args.host, args.port)
+        return
+
+    engine = bootstrap()
+    try:
+        inputs = json.loads(args.inputs)
+        if not isinstance(inputs, dict):
+            raise QuoteInputError({"inputs": "esperado um objeto JSON"})
+        result = quote(engine, args.company, args.service, inputs)
+    except QuoteInputError as e:
+        print(json.dumps({"error": "entrada inválida", "fields": e.errors}, ensure_ascii=False), file=sys.stderr)
+        sys.exit(2)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,32 @@
+import io
+import os
+
 import streamlit as st
 from streamlit_option_menu import option_menu
 
 from assets.ui import inject_css, section, kpi
-from core.auth import hash_password, verify_password
+from core import instrument
+from core.catalog_io import import_price_list, export_price_list
+from core.auth import AuthBusy, authenticate, hash_password
+from core.bootstrap import bootstrap
+from core.cache import env_int
 from core.db import (
-    get_engine, init_db,
-    create_user_with_company, get_user_by_email,
-    get_membership_company, get_subscription_status,
-    list_items, upsert_item, seed_company_items
+    unit_of_work, pool_stats,
+    provision_tenant, get_user_by_email,
+    list_memberships, list_members, add_member, MembershipError, get_subscription_status,
+    list_invites, redeem_invite, INVITE_TTL_DAYS,
+    list_items, list_items_page, upsert_item, bulk_upsert_items,
+    save_quote, list_quotes, get_quote, price_history, item_rollups, quote_rollups
 )
-from core.money import brl
+from core.money import brl_cents, to_cents
+from core.render import PDF_AVAILABLE, content_hash, render_async
+from services.engine import cftv_dynamic, quote_cache_stats
 
 st.set_page_config(page_title="RR Smart | Portal", page_icon="🧾", layout="wide")
-inject_css()
 
-engine = get_engine()
-init_db(engine)
+engine = bootstrap()
 
+@instrument.profiled("auth")
 def require_login():
     if "user" not in st.session_state:
         st.session_state.user = None
@@ -24,6 +34,33 @@ def require_login():
         auth_page()
         st.stop()
 
+# quantos proxies confiáveis acrescentam ao X-Forwarded-For (Railway: 1)
+TRUSTED_PROXY_HOPS = max(1, env_int("TRUSTED_PROXY_HOPS", 1))
+
+def client_ip() -> str:
+    # atrás do proxy do Railway o IP real vem no X-Forwarded-For; o começo da lista é do cliente
+    # (forjável), então vale a entrada que o último proxy confiável acrescentou, contando da direita
+    hops = [h.strip() for h in st.context.headers.get("X-Forwarded-For", "").split(",") if h.strip()]
+    return hops[-min(TRUSTED_PROXY_HOPS, len(hops))] if hops else ""
+
+# estado de página que pertence à empresa ativa; some ao trocar de empresa
+TENANT_STATE = ("cat_filter", "cat_cursors", "catalog_export", "quote_history", "doc_jobs")
+
+def start_session(u: dict) -> bool:
+    mems = list_memberships(engine, u["id"])
+    if not mems:
+        return False
+    st.session_state.user = {"id": u["id"], "name": u["name"], "email": u["email"], "memberships": mems, **mems[0]}
+    return True
+
+def switch_company(company_id: int):
+    # troca instantânea: a lista veio no login; assinatura e catálogo da empresa entram no cache no 1º uso
+    u = st.session_state.user
+    mem = next(m for m in u["memberships"] if m["company_id"] == company_id)
+    u.update(mem)
+    for k in TENANT_STATE:
+        st.session_state.pop(k, None)
+
 def auth_page():
     section("Acesso", "Entre com sua conta ou crie uma nova (trial automático).")
     tab1, tab2 = st.tabs(["Entrar", "Criar conta"])
@@ -36,15 +73,20 @@ def auth_page():
             password = st.text_input("Senha", type="password", key="login_pass")
 
         if st.button("Entrar", type="primary"):
-            u = get_user_by_email(engine, email)
-            if not u or not verify_password(password, u["password_hash"]):
+            try:
+                u, reason = authenticate(engine, email, password, ip=client_ip())
+            except AuthBusy:
+                st.error("Servidor ocupado, tente novamente em instantes.")
+                return
+            if reason == "throttled":
+                st.error("Muitas tentativas. Aguarde alguns minutos e tente novamente.")
+                return
+            if not u:
                 st.error("Email ou senha inválidos.")
                 return
-            mem = get_membership_company(engine, u["id"])
-            if not mem:
+            if not start_session(u):
                 st.error("Sua conta não tem empresa vinculada.")
                 return
-            st.session_state.user = {"id": u["id"], "name": u["name"], "email": u["email"], **mem}
             st.rerun()
 
     with tab2:
@@ -58,18 +100,28 @@ def auth_page():
             if not (name.strip() and company.strip() and email.strip() and password.strip()):
                 st.error("Preencha nome, empresa, email e senha.")
                 return
+            # email já usado: responde antes do PBKDF2 (o provision_tenant ainda cobre a corrida)
             if get_user_by_email(engine, email):
                 st.error("Esse email já está cadastrado.")
                 return
-            res = create_user_with_company(engine, email, name, hash_password(password), company, whatsapp)
-            # seed itens iniciais da empresa
-            seed_company_items(engine, res["company_id"])
-            u = get_user_by_email(engine, email)
-            mem = get_membership_company(engine, u["id"])
-            st.session_state.user = {"id": u["id"], "name": u["name"], "email": u["email"], **mem}
+            try:
+                ph = hash_password(password)
+            except AuthBusy:
+                st.error("Servidor ocupado, tente novamente em instantes.")
+                return
+            # um comando só: usuário, empresa, vínculo e trial; o catálogo é herdado do base
+            res = provision_tenant(engine, email, name, ph, company, whatsapp)
+            if res is None:
+                st.error("Esse email já está cadastrado.")
+                return
+            st.session_state.user = {**res["user"], "memberships": [res["membership"]], **res["membership"]}
             st.success("Conta criada! Trial ativado.")
             st.rerun()
 
+# painel de desempenho enxerga consultas de todas as empresas: só para os e-mails listados
+ADMIN_EMAILS = {e.strip().lower() for e in os.getenv("PORTAL_ADMIN_EMAILS", "").split(",") if e.strip()}
+
+@instrument.profiled("guard")
 def subscription_guard(company_id: int):
     sub = get_subscription_status(engine, company_id)
     if not sub["active"]:
@@ -78,137 +130,414 @@ def subscription_guard(company_id: int):
         st.stop()
     return sub
 
-# ---------- APP ----------
-require_login()
-u = st.session_state.user
-sub = subscription_guard(u["company_id"])
-
-with st.sidebar:
-    st.markdown("### RR Smart Soluções")
-    st.caption(f"👤 {u['name']}")
-    st.caption(f"🏢 {u['company_name']}")
-    st.caption(f"📦 Plano: {sub['plan_name']} ({sub['status']})")
-    page = option_menu(
-        None,
-        ["Dashboard", "Catálogo de Itens", "Orçar CFTV (dinâmico)"],
-        icons=["speedometer2", "tags", "camera-video"],
-        default_index=0,
-        styles={
-            "container": {"padding": "0.35rem"},
-            "nav-link": {"border-radius": "12px"},
-            "nav-link-selected": {"background-color": "rgba(124,92,255,0.22)"},
-        },
-    )
-    if st.button("Sair"):
-        st.session_state.user = None
-        st.rerun()
-
-if page == "Dashboard":
-    section("Dashboard", "Base SaaS pronta: usuários, empresa, plano e dados persistentes no Postgres.")
-
-    c1, c2, c3 = st.columns(3)
+@instrument.profiled("ui.quote_document")
+def quote_document(quote: dict, company: dict, key: str):
+    # gera o documento num worker; o fragmento consulta o job sem bloquear o rerun
+    jobs = st.session_state.setdefault("doc_jobs", {})
+    c1, c2 = st.columns([2, 1])
     with c1:
-        kpi("Empresa", u["company_name"], "Tenant ativo", badge="SaaS")
+        fmt = st.selectbox("Documento", ["pdf", "html"] if PDF_AVAILABLE else ["html"], key=f"{key}_fmt")
+        if not PDF_AVAILABLE:
+            st.caption("PDF indisponível neste servidor (weasyprint/Pango); o HTML pode ser impresso em PDF pelo navegador.")
+    # o job vale para o conteúdo em que foi gerado: quantidades, preços ou formato mudaram, o download some
+    h = content_hash(quote, company, fmt)
+    if key in jobs and jobs[key][0] != h:
+        del jobs[key]
     with c2:
-        kpi("Plano", sub["plan_name"], f"Status: {sub['status']}", badge="OK" if sub["active"] else "Bloq")
-    with c3:
-        kpi("Módulo", "Segurança", "Pronto para plugins", badge="v1")
-
-    st.markdown("### Próximo passo")
-    st.write("Agora vamos plugar seus serviços (cerca, concertina, etc.) usando esse banco por empresa.")
-
-elif page == "Catálogo de Itens":
-    section("Catálogo de Itens", "Aqui você cadastra/edita itens e fica salvo no Railway (Postgres).")
-
-    module = st.selectbox("Módulo", ["seguranca"], index=0)
-    category = st.selectbox("Categoria", ["cftv_camera", "cftv", "mao_obra", "cerca", "concertina", "estrutura", "eletrificador"], index=0)
-    q = st.text_input("Buscar", value="")
-
-    items = list_items(engine, u["company_id"], module=module, category=category, search=q)
-
-    c1, c2, c3 = st.columns(3)
-    with c1: kpi("Categoria", category, "Filtro aplicado")
-    with c2: kpi("Itens", str(len(items)), "Ativos no catálogo")
-    with c3: kpi("Persistência", "Postgres", "Não perde no deploy", badge="Railway")
-
-    st.markdown("### Itens")
-    for it in items:
-        a, b, c = st.columns([5, 2, 2])
-        with a:
-            st.markdown(f"**{it['name']}**")
-            st.caption(f"`{it['key']}` • {it['unit']}")
-        with b:
-            new_price = st.number_input("Preço", value=float(it["price"]), min_value=0.0, step=1.0, key=f"p_{it['key']}")
-        with c:
-            if st.button("Salvar", key=f"s_{it['key']}"):
-                upsert_item(engine, u["company_id"], it["key"], it["name"], module, category, it["unit"], new_price)
-                st.success("Atualizado!")
-                st.rerun()
+        if st.button("Gerar documento", key=f"{key}_gen"):
+            jobs[key] = (h, render_async(quote, company, fmt))
+
+    job = jobs.get(key)
+    if not job:
+        return
+    _, fut = job
+    polling = not fut.done()
+
+    @st.fragment(run_every=1.0 if polling else None)
+    def status():
+        if not fut.done():
+            st.caption("⏳ Gerando documento...")
+            return
+        if polling:
+            st.rerun()
+        if fut.exception() is not None:
+            st.error(f"Falha ao gerar documento: {fut.exception()}")
+            return
+        st.download_button(
+            f"Baixar {fmt.upper()}",
+            data=fut.result(),
+            file_name=f"orcamento.{fmt}",
+            mime="application/pdf" if fmt == "pdf" else "text/html",
+            key=f"{key}_dl",
+        )
+
+    status()
 
-    st.markdown('<div class="hr"></div>', unsafe_allow_html=True)
-    st.markdown("### ➕ Cadastrar novo item")
-    with st.form("new_item"):
-        key = st.text_input("Chave (ex: cftv_camera_bullet_6mp)")
-        name = st.text_input("Nome (ex: Câmera Bullet 6MP)")
-        unit = st.selectbox("Unidade", ["un", "m", "m2", "taxa"], index=0)
-        price = st.number_input("Preço", value=0.0, min_value=0.0, step=1.0)
-        ok = st.form_submit_button("Cadastrar")
-        if ok:
-            if not key.strip() or not name.strip():
-                st.error("Informe chave e nome.")
-            else:
-                upsert_item(engine, u["company_id"], key.strip(), name.strip(), module, category, unit, price)
-                st.success("Item cadastrado e salvo no Postgres!")
+# ---------- APP ----------
+def main():
+    u = st.session_state.user
+
+    # a troca de empresa vem antes do guard: uma empresa bloqueada não prende o usuário
+    with st.sidebar, instrument.span("sidebar"):
+        st.markdown("### RR Smart Soluções")
+        st.caption(f"👤 {u['name']}")
+        mems = u["memberships"]
+        if len(mems) > 1:
+            ids = [m["company_id"] for m in mems]
+            names = {m["company_id"]: m["company_name"] for m in mems}
+            cid = st.selectbox("🏢 Empresa", ids, index=ids.index(u["company_id"]), format_func=names.get)
+            if cid != u["company_id"]:
+                switch_company(cid)
                 st.rerun()
+        else:
+            st.caption(f"🏢 {u['company_name']}")
+
+        with st.expander("Código de convite"):
+            code = st.text_input("Código", key="invite_code", label_visibility="collapsed")
+            if st.button("Entrar na empresa", key="invite_redeem") and code.strip():
+                cid = redeem_invite(engine, u["id"], code)
+                if cid is None:
+                    st.error("Código inválido ou vencido.")
+                else:
+                    u["memberships"] = list_memberships(engine, u["id"])
+                    switch_company(cid)
+                    st.rerun()
+
+    sub = subscription_guard(u["company_id"])
+
+    with st.sidebar, instrument.span("sidebar"):
+        st.caption(f"📦 Plano: {sub['plan_name']} ({sub['status']})")
+        pages = ["Dashboard", "Catálogo de Itens", "Orçar CFTV (dinâmico)", "Orçamentos"]
+        icons = ["speedometer2", "tags", "camera-video", "journal-text"]
+        if u["email"].lower() in ADMIN_EMAILS:
+            pages.append("Desempenho")
+            icons.append("activity")
+        page = option_menu(
+            None,
+            pages,
+            icons=icons,
+            default_index=0,
+            styles={
+                "container": {"padding": "0.35rem"},
+                "nav-link": {"border-radius": "12px"},
+                "nav-link-selected": {"background-color": "rgba(124,92,255,0.22)"},
+            },
+        )
+        if st.button("Sair"):
+            st.session_state.user = None
+            st.rerun()
 
-else:
-    section("Orçar CFTV (dinâmico)", "Selecione 1 ou vários tipos de câmera do catálogo e informe as quantidades.")
+    instrument.tag(page)
 
-    # carrega todas as câmeras da categoria cftv_camera
-    cams = list_items(engine, u["company_id"], module="seguranca", category="cftv_camera", search="")
-    if not cams:
-        st.warning("Nenhum tipo de câmera cadastrado. Vá em 'Catálogo de Itens' e cadastre em categoria 'cftv_camera'.")
-        st.stop()
+    if page == "Dashboard":
+        section("Dashboard", "Indicadores da empresa a partir dos agregados (catálogo e orçamentos dos últimos 30 dias).")
 
-    cam_labels = [f"{c['name']} ({brl(c['price'])})" for c in cams]
-    cam_map = {cam_labels[i]: cams[i] for i in range(len(cams))}
+        cats = item_rollups(engine, u["company_id"])
+        daily = quote_rollups(engine, u["company_id"], days=30)
+        n_quotes = sum(d["quote_count"] for d in daily)
+        revenue = sum(d["revenue_cents"] for d in daily)
 
-    selected = st.multiselect("Tipos de câmera", cam_labels, default=[cam_labels[0]])
-    if not selected:
-        st.info("Selecione pelo menos 1 tipo de câmera.")
-        st.stop()
+        c1, c2, c3, c4 = st.columns(4)
+        with c1:
+            kpi("Empresa", u["company_name"], "Tenant ativo", badge="SaaS")
+        with c2:
+            kpi("Plano", sub["plan_name"], f"Status: {sub['status']}", badge="OK" if sub["active"] else "Bloq")
+        with c3:
+            kpi("Itens no catálogo", str(sum(c["item_count"] for c in cats)), f"{len(cats)} categorias")
+        with c4:
+            kpi("Orçamentos (30 dias)", str(n_quotes), f"{brl_cents(revenue)} · ticket médio {brl_cents(revenue // n_quotes if n_quotes else 0)}")
+
+        if daily:
+            by_day = {}
+            for d in daily:
+                by_day.setdefault(d["day"], {})[d["service_id"]] = d["revenue_cents"] / 100
+            st.markdown("### Valor orçado por dia (R$)")
+            st.bar_chart([{"Dia": day, **svc} for day, svc in by_day.items()], x="Dia")
+
+        st.markdown("### Catálogo por categoria")
+        st.dataframe(
+            [{"Categoria": c["category"], "Itens": c["item_count"], "Preço médio": brl_cents(c["avg_cents"]),
+              "Mínimo": brl_cents(c["min_cents"]), "Máximo": brl_cents(c["max_cents"])} for c in cats],
+            hide_index=True,
+            use_container_width=True,
+        )
+
+        members = list_members(engine, u["company_id"])
+        invites = list_invites(engine, u["company_id"]) if u["role"] == "admin" else []
+        st.markdown(f"### Equipe ({len(members) + len(invites)}/{sub['max_users']})")
+        for m in members:
+            st.write(f"• **{m['name']}** — {m['email']} ({m['role']})")
+        for inv in invites:
+            st.write(f"• {inv['email']} ({inv['role']}) — convite pendente")
+        if u["role"] == "admin" and len(members) + len(invites) < sub["max_users"]:
+            with st.form("add_member", clear_on_submit=True):
+                new_email = st.text_input("Convidar pessoa (email)")
+                if st.form_submit_button("Convidar"):
+                    try:
+                        invited = add_member(engine, u["company_id"], new_email)
+                    except MembershipError as e:
+                        st.error(str(e))
+                    else:
+                        # o código aparece uma única vez; sem st.rerun para não sumir da tela
+                        st.success(f"Convite criado para {invited['email']}. Envie o código abaixo à pessoa: ela entra "
+                                   f"na equipe ao informá-lo em \"Código de convite\", já logada (uso único, vale "
+                                   f"{INVITE_TTL_DAYS} dias).")
+                        st.code(invited["code"], language=None)
+
+    elif page == "Catálogo de Itens":
+        section("Catálogo de Itens", "Aqui você cadastra/edita itens e fica salvo no Railway (Postgres).")
+
+        module = st.selectbox("Módulo", ["seguranca"], index=0)
+        category = st.selectbox("Categoria", ["cftv_camera", "cftv", "mao_obra", "cerca", "concertina", "estrutura", "eletrificador"], index=0)
+        q = st.text_input("Buscar", value="")
+
+        page_size = st.selectbox("Itens por página", [25, 50, 100], index=1)
+
+        # pilha de cursores keyset; volta para a 1ª página quando o filtro muda
+        filt = (module, category, q, page_size)
+        if st.session_state.get("cat_filter") != filt:
+            st.session_state.cat_filter = filt
+            st.session_state.cat_cursors = [None]
+        cursors = st.session_state.cat_cursors
+
+        items, next_cursor = list_items_page(engine, u["company_id"], module=module, category=category, search=q,
+                                             after=cursors[-1], limit=page_size)
+
+        c1, c2, c3 = st.columns(3)
+        with c1: kpi("Categoria", category, "Filtro aplicado")
+        with c2: kpi("Itens", str(len(items)), f"Página {len(cursors)}")
+        with c3: kpi("Persistência", "Postgres", "Não perde no deploy", badge="Railway")
+
+        st.markdown("### Itens")
+        with st.form(f"catalog_page_{len(cursors)}"):
+            edited = st.data_editor(
+                [{"key": it["key"], "name": it["name"], "unit": it["unit"], "price": it["price_cents"] / 100} for it in items],
+                column_config={
+                    "key": st.column_config.TextColumn("Chave", disabled=True),
+                    "name": st.column_config.TextColumn("Nome", required=True),
+                    "unit": st.column_config.SelectboxColumn("Unidade", options=["un", "m", "m2", "taxa"], required=True),
+                    "price": st.column_config.NumberColumn("Preço", min_value=0.0, step=1.0, format="R$ %.2f", required=True),
+                },
+                hide_index=True,
+                use_container_width=True,
+                num_rows="fixed",
+                key=f"catalog_grid_{len(cursors)}",
+            )
+            saved = st.form_submit_button("Salvar alterações", type="primary")
+
+        if saved:
+            rows = edited.to_dict("records") if hasattr(edited, "to_dict") else list(edited)
+            changed = [
+                {"key": it["key"], "name": str(r["name"]).strip(), "module": module, "category": it["category"], "unit": r["unit"], "price_cents": to_cents(r["price"])}
+                for it, r in zip(items, rows)
+                if (str(r["name"]).strip(), r["unit"], to_cents(r["price"])) != (it["name"], it["unit"], it["price_cents"])
+            ]
+            if changed:
+                # uma única escrita em lote para todas as linhas alteradas da página
+                bulk_upsert_items(engine, u["company_id"], changed)
+                st.success(f"{len(changed)} item(ns) atualizado(s)!")
+                st.rerun()
+            else:
+                st.info("Nenhuma alteração para salvar.")
+
+        # só consulta o histórico quando pedido, não a cada rerun do catálogo
+        if items and st.toggle("Histórico de preço"):
+            with st.container(border=True):
+                hk = st.selectbox("Item", [it["key"] for it in items], format_func=lambda k: next(it["name"] for it in items if it["key"] == k))
+                st.dataframe(
+                    [{"Vigente desde": f"{h['effective_from']:%d/%m/%Y %H:%M}", "Preço": brl_cents(h["price_cents"])}
+                     for h in price_history(engine, u["company_id"], hk, limit=20)],
+                    hide_index=True,
+                    use_container_width=True,
+                )
+
+        p1, p2 = st.columns(2)
+        with p1:
+            if len(cursors) > 1 and st.button("◀ Anterior"):
+                cursors.pop()
+                st.rerun()
+        with p2:
+            if next_cursor is not None and st.button("Próxima ▶"):
+                cursors.append(next_cursor)
+                st.rerun()
+
+        st.markdown('<div class="hr"></div>', unsafe_allow_html=True)
+        st.markdown("### ➕ Cadastrar novo item")
+        with st.form("new_item"):
+            key = st.text_input("Chave (ex: cftv_camera_bullet_6mp)")
+            name = st.text_input("Nome (ex: Câmera Bullet 6MP)")
+            unit = st.selectbox("Unidade", ["un", "m", "m2", "taxa"], index=0)
+            price = st.number_input("Preço", value=0.0, min_value=0.0, step=1.0)
+            ok = st.form_submit_button("Cadastrar")
+            if ok:
+                if not key.strip() or not name.strip():
+                    st.error("Informe chave e nome.")
+                else:
+                    upsert_item(engine, u["company_id"], key.strip(), name.strip(), module, category, unit, to_cents(price))
+                    st.success("Item cadastrado e salvo no Postgres!")
+                    st.rerun()
+
+        st.markdown('<div class="hr"></div>', unsafe_allow_html=True)
+        st.markdown("### 📦 Importar / exportar lista de preços")
+        c1, c2 = st.columns(2)
+        with c1:
+            up = st.file_uploader("Arquivo CSV ou JSONL (colunas: key, name, price, module, category, unit)", type=["csv", "jsonl"])
+            if up is not None and st.button("Importar", type="primary"):
+                fmt = "jsonl" if up.name.lower().endswith(".jsonl") else "csv"
+                try:
+                    rep = import_price_list(engine, u["company_id"], io.TextIOWrapper(up, encoding="utf-8-sig"), fmt=fmt)
+                except ValueError as e:
+                    st.error(f"Arquivo inválido: {e}")
+                else:
+                    st.success(f"Novos: {rep['inserted']} • Atualizados: {rep['updated']} • Sem mudança: {rep['unchanged']} • Inválidos: {rep['invalid']}")
+                    for err in rep["errors"]:
+                        st.caption(err)
+        with c2:
+            fmt = st.selectbox("Formato de exportação", ["csv", "jsonl"], index=0)
+            # só consulta o banco quando pedido, não a cada rerun
+            if st.button("Gerar exportação"):
+                st.session_state.catalog_export = (fmt, "".join(export_price_list(engine, u["company_id"], fmt=fmt)))
+            exp = st.session_state.get("catalog_export")
+            if exp:
+                st.download_button(
+                    "Baixar catálogo",
+                    data=exp[1],
+                    file_name=f"catalogo.{exp[0]}",
+                    mime="text/csv" if exp[0] == "csv" else "application/jsonl",
+                )
+
+    elif page == "Orçar CFTV (dinâmico)":
+        section("Orçar CFTV (dinâmico)", "Selecione 1 ou vários tipos de câmera do catálogo e informe as quantidades.")
+
+        # carrega todas as câmeras da categoria cftv_camera
+        cams = list_items(engine, u["company_id"], module="seguranca", category="cftv_camera", search="")
+        if not cams:
+            st.warning("Nenhum tipo de câmera cadastrado. Vá em 'Catálogo de Itens' e cadastre em categoria 'cftv_camera'.")
+            st.stop()
+
+        cam_labels = [f"{c['name']} ({brl_cents(c['price_cents'])})" for c in cams]
+        cam_map = {cam_labels[i]: cams[i] for i in range(len(cams))}
+
+        selected = st.multiselect("Tipos de câmera", cam_labels, default=[cam_labels[0]])
+        if not selected:
+            st.info("Selecione pelo menos 1 tipo de câmera.")
+            st.stop()
+
+        st.markdown("### Quantidades")
+        quantities = {}
+        for label in selected:
+            cam = cam_map[label]
+            quantities[cam["key"]] = int(st.number_input(f"Qtd — {cam['name']}", min_value=0, step=1, value=1, key=f"q_{cam['key']}"))
+
+        st.markdown('<div class="hr"></div>', unsafe_allow_html=True)
+
+        # mesmo cálculo headless usado pela API (services.engine)
+        quote = cftv_dynamic(engine, u["company_id"], quantities)
+
+        c1, c2, c3 = st.columns(3)
+        with c1: kpi("Câmeras (total)", str(quote["total_cameras"]), "Soma de todos os tipos")
+        with c2: kpi("Materiais", brl_cents(quote["materials_cents"]), "Câmeras selecionadas")
+        with c3: kpi("Total", brl_cents(quote["subtotal_cents"]), f"Mão de obra: {brl_cents(quote['labor_cents'])}", badge="Prévia")
+
+        st.markdown("### Resumo")
+        for ln in quote["items"]:
+            st.write(f"• **{ln['desc']}** — {ln['qty']} × {brl_cents(ln['unit_cents'])} = **{brl_cents(ln['sub_cents'])}**")
+
+        st.markdown('<div class="hr"></div>', unsafe_allow_html=True)
+        customer = st.text_input("Cliente (opcional)", key="quote_customer")
+        if st.button("Salvar orçamento", type="primary"):
+            quote_id = save_quote(engine, u["company_id"], u["id"], quote, customer=customer)
+            st.session_state.pop("quote_history", None)
+            st.success(f"Orçamento #{quote_id} salvo!")
+
+        quote_document({**quote, "customer": customer}, u, key="doc_preview")
+
+    elif page == "Orçamentos":
+        section("Orçamentos", "Histórico de orçamentos salvos da empresa (mais recentes primeiro).")
+
+        # páginas já carregadas ficam na sessão; "Carregar mais" busca só a próxima (keyset)
+        if "quote_history" not in st.session_state:
+            st.session_state.quote_history = list_quotes(engine, u["company_id"], limit=25)
+        quotes, next_cursor = st.session_state.quote_history
+
+        if not quotes:
+            st.info("Nenhum orçamento salvo ainda. Use 'Orçar CFTV (dinâmico)' e clique em 'Salvar orçamento'.")
+            st.stop()
+
+        st.dataframe(
+            [{"#": qt["id"], "Data": f"{qt['created_at']:%d/%m/%Y %H:%M}", "Serviço": qt["service_name"],
+              "Cliente": qt["customer"], "Itens": qt["line_count"], "Total": brl_cents(qt["subtotal_cents"])} for qt in quotes],
+            hide_index=True,
+            use_container_width=True,
+        )
+
+        if next_cursor is not None and st.button("Carregar mais"):
+            more, cur = list_quotes(engine, u["company_id"], before=next_cursor, limit=25)
+            st.session_state.quote_history = (quotes + more, cur)
+            st.rerun()
 
-    st.markdown("### Quantidades")
-    total_cameras = 0
-    items = []
-    subtotal = 0.0
-
-    for label in selected:
-        cam = cam_map[label]
-        qty = st.number_input(f"Qtd — {cam['name']}", min_value=0, step=1, value=1, key=f"q_{cam['key']}")
-        if qty > 0:
-            total_cameras += qty
-            sub = qty * float(cam["price"])
-            items.append((cam["name"], qty, float(cam["price"]), sub))
-            subtotal += sub
-
-    st.markdown('<div class="hr"></div>', unsafe_allow_html=True)
-
-    # mão de obra por câmera
-    mao = list_items(engine, u["company_id"], module="seguranca", category="mao_obra", search="por câmera")
-    mao_unit = 0.0
-    if mao:
-        mao_unit = float(mao[0]["price"])
-
-    mao_total = total_cameras * mao_unit
-    total = subtotal + mao_total
-
-    c1, c2, c3 = st.columns(3)
-    with c1: kpi("Câmeras (total)", str(total_cameras), "Soma de todos os tipos")
-    with c2: kpi("Materiais", brl(subtotal), "Câmeras selecionadas")
-    with c3: kpi("Total", brl(total), f"Mão de obra: {brl(mao_total)}", badge="Prévia")
-
-    st.markdown("### Resumo")
-    for (name, qty, unit, sub) in items:
-        st.write(f"• **{name}** — {qty} × {brl(unit)} = **{brl(sub)}**")
-    st.write(f"• **Mão de obra por câmera** — {total_cameras} × {brl(mao_unit)} = **{brl(mao_total)}**")
+        sel = st.selectbox("Ver orçamento", [qt["id"] for qt in quotes], format_func=lambda i: f"#{i}")
+        full = get_quote(engine, u["company_id"], sel)
+        for ln in (full or {}).get("items", []):
+            st.write(f"• **{ln['desc']}** — {ln['qty']:g} × {brl_cents(ln['unit_cents'])} = **{brl_cents(ln['sub_cents'])}**")
+        if full:
+            quote_document(full, u, key=f"doc_{sel}")
+
+    elif page == "Desempenho":
+        section("Desempenho", "Consultas por helper do core, consultas lentas e custo de banco por rerun (deste processo).")
+        snap = instrument.snapshot()
+        if not snap["enabled"]:
+            st.info("Instrumentação desligada (DB_INSTRUMENT=0).")
+            st.stop()
+
+        if snap["profile"]:
+            st.markdown("### Seções e widgets mais lentos (p95, tempo inclusivo)")
+            st.dataframe(
+                [{"Seção": sp["name"], "N": sp["count"], "Média (ms)": sp["avg_ms"], "p50": sp["p50_ms"],
+                  "p95": sp["p95_ms"], "Máx": sp["max_ms"]} for sp in snap["spans"]],
+                hide_index=True,
+                use_container_width=True,
+            )
+        else:
+            st.caption("Perfil por seção desligado: defina PORTAL_PROFILE=1 para medir auth, guard, sidebar, páginas, CSS e widgets.")
+
+        st.markdown("### Últimos reruns")
+        st.dataframe(
+            [{"Página": r["label"], "Consultas": r["queries"], "Banco (ms)": r["db_ms"], "Total (ms)": r["elapsed_ms"],
+              "Mais caro": next(iter(r["by_caller"]), ""), "Seção mais lenta": next(iter(r["spans"]), "")} for r in snap["reruns"]],
+            hide_index=True,
+            use_container_width=True,
+        )
+
+        st.markdown("### Consultas (por tempo total)")
+        st.dataframe(
+            [{"Helper": q["caller"], "N": q["count"], "Total (ms)": q["total_ms"], "p50": q["p50_ms"], "p95": q["p95_ms"],
+              "p99": q["p99_ms"], "Máx": q["max_ms"], "Linhas": q["rows"], "SQL": q["statement"]} for q in snap["queries"]],
+            hide_index=True,
+            use_container_width=True,
+        )
+
+        st.markdown(f"### Consultas lentas (≥ {snap['slow_query_ms']:g} ms)")
+        if snap["slow"]:
+            st.dataframe(snap["slow"], hide_index=True, use_container_width=True)
+        else:
+            st.caption("Nenhuma até agora.")
+
+        ps = pool_stats(engine)
+        st.caption(f"Pool de conexões: {ps.get('checkedout', '?')} em uso / {ps.get('size', '?')} "
+                   f"(overflow {ps.get('overflow', 0)}) · {ps['checkouts']} checkouts · espera média "
+                   f"{ps['wait_avg_ms']:.2f} ms, máx {ps['wait_max_ms']:.1f} ms")
+
+        qc = quote_cache_stats()
+        st.caption(f"Orçamentos memorizados: {qc['size']} em cache · {qc['hits']} acertos / {qc['misses']} falhas "
+                   f"({qc['hit_rate']:.0%})")
+
+        st.download_button("Baixar JSON", data=instrument.dump_json(), file_name="db_instrument.json", mime="application/json")
+
+with instrument.track("rerun"):
+    inject_css()
+    # login fora do unit of work: o PBKDF2 (até AUTH_HASH_TIMEOUT) não segura uma conexão do pool
+    require_login()
+    # uma conexão do pool para o resto do rerun, em vez de um checkout por consulta
+    with unit_of_work(engine):
+        main()
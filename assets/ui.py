@@ -1,10 +1,21 @@
 import pathlib
+from functools import lru_cache
+
 import streamlit as st
 
-def inject_css():
+from core.instrument import profiled
+
+@lru_cache(maxsize=1)
+def _css() -> str:
+    # lido uma vez por processo, não a cada rerun
     css = pathlib.Path("assets/style.css").read_text(encoding="utf-8")
-    st.markdown(f"<style>{css}</style>", unsafe_allow_html=True)
+    return f"<style>{css}</style>"
+
+@profiled("ui.css")
+def inject_css():
+    st.markdown(_css(), unsafe_allow_html=True)
 
+@profiled("ui.kpi")
 def kpi(title: str, value: str, sub: str = "", badge: str = ""):
     st.markdown(
         f"""
@@ -20,6 +31,7 @@ def kpi(title: str, value: str, sub: str = "", badge: str = ""):
         unsafe_allow_html=True,
     )
 
+@profiled("ui.section")
 def section(title: str, subtitle: str = ""):
     st.markdown(f"## {title}")
     if subtitle:
@@ -0,0 +1 @@
+# benchmarks: rode com `python -m bench.<nome>`
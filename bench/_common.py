@@ -0,0 +1,40 @@
+import math
+import time
+from typing import Any, Callable, Dict, List
+
+def timeit(fn: Callable[[], Any], repeat: int = 5) -> float:
+    # melhor de N execuções, em segundos
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def report(name: str, n: int, seconds: float) -> Dict[str, Any]:
+    row = {"name": name, "n": n, "seconds": seconds, "per_sec": n / seconds if seconds else float("inf")}
+    print(f"{name:<32} n={n:<8} {seconds * 1000:9.2f} ms  {row['per_sec']:>14,.0f}/s")
+    return row
+
+def sample(fn: Callable[[int], Any], n: int, warmup: int = 3) -> List[float]:
+    # latência de cada chamada, em segundos (fn recebe o índice da iteração)
+    for i in range(warmup):
+        fn(i)
+    out = []
+    for i in range(n):
+        t0 = time.perf_counter()
+        fn(i)
+        out.append(time.perf_counter() - t0)
+    return out
+
+def latency(name: str, samples: List[float], **extra: Any) -> Dict[str, Any]:
+    # p50/p95/p99 pelo método do posto mais próximo; vazão = chamadas / tempo somado
+    s = sorted(samples)
+    n = len(s)
+    pct = lambda p: s[min(n - 1, max(0, math.ceil(p / 100 * n) - 1))] * 1000
+    total = sum(s)
+    row = {"name": name, **extra, "n": n, "p50_ms": pct(50), "p95_ms": pct(95), "p99_ms": pct(99),
+           "max_ms": s[-1] * 1000, "per_sec": n / total if total else float("inf")}
+    print(f"{name:<32} {' '.join(f'{k}={v}' for k, v in extra.items()):<14} p50={row['p50_ms']:8.2f} ms  "
+          f"p95={row['p95_ms']:8.2f} ms  p99={row['p99_ms']:8.2f} ms  {row['per_sec']:>10,.0f}/s")
+    return row
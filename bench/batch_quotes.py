@@ -0,0 +1,47 @@
+import argparse
+import random
+
+from bench._common import report, timeit
+from services import concertina_linear, fence
+from services.batch import concertina_batch, fence_batch
+
+PRICES = {"haste_reta": 1890, "haste_canto": 3250, "concertina_linear_20m": 14990}
+
+def scenarios(n: int, seed: int = 42):
+    rnd = random.Random(seed)
+    out = []
+    for _ in range(n):
+        out.append({
+            "per": round(rnd.uniform(1.0, 500.0), 2),
+            "fios": rnd.randint(1, 10),
+            "espac": rnd.choice([0.5, 1.0, 1.5, 2.0, 2.5, 3.0, 3.5, 5.0]),
+            "cantos": rnd.randint(1, 20),
+        })
+    return out
+
+def main():
+    ap = argparse.ArgumentParser(description="Compara o compute escalar com o lote vetorizado")
+    ap.add_argument("-n", type=int, default=10_000)
+    args = ap.parse_args()
+
+    conc = scenarios(args.n)
+    cerca = [{"perimetro": s["per"], "espac": s["espac"], "cantos": s["cantos"]} for s in conc]
+
+    # os resultados precisam bater exatamente com o compute escalar
+    vf = fence_batch(PRICES, cerca)
+    vc = concertina_batch(PRICES, conc)
+    for i in range(args.n):
+        sf = fence.compute(PRICES, cerca[i])
+        sc = concertina_linear.compute(PRICES, conc[i])
+        assert sf["subtotal_cents"] == vf["subtotal_cents"][i], (i, sf["subtotal_cents"], vf["subtotal_cents"][i])
+        assert sc["subtotal_cents"] == vc["subtotal_cents"][i], (i, sc["subtotal_cents"], vc["subtotal_cents"][i])
+        assert [it["qty"] for it in sc["items"]] == [vc["retas"][i], vc["cantos"][i], vc["rolos"][i]]
+    print(f"ok: {args.n} cenários idênticos ao compute escalar")
+
+    report("cerca escalar", args.n, timeit(lambda: [fence.compute(PRICES, s) for s in cerca], repeat=3))
+    report("cerca vetorizado", args.n, timeit(lambda: fence_batch(PRICES, cerca)))
+    report("concertina escalar", args.n, timeit(lambda: [concertina_linear.compute(PRICES, s) for s in conc], repeat=3))
+    report("concertina vetorizado", args.n, timeit(lambda: concertina_batch(PRICES, conc)))
+
+if __name__ == "__main__":
+    main()
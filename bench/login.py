@@ -0,0 +1,32 @@
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench._common import report
+
+def main():
+    ap = argparse.ArgumentParser(description="Vazão de login (verify_password) sob concorrência")
+    ap.add_argument("-n", type=int, default=200, help="logins")
+    ap.add_argument("--threads", type=int, default=16, help="sessões simultâneas")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="AUTH_HASH_WORKERS (0 = no thread)")
+    args = ap.parse_args()
+
+    # o pool lê a configuração no import
+    os.environ["AUTH_HASH_WORKERS"] = str(args.workers)
+    os.environ.setdefault("AUTH_HASH_QUEUE_PER_WORKER", str(max(4, args.threads)))
+    from core.auth import PBKDF2_ROUNDS, hash_password, verify_password
+
+    hashed = hash_password("senha-123")
+    verify_password("aquecimento", hashed)  # sobe os workers antes de medir
+
+    with ThreadPoolExecutor(max_workers=args.threads) as ex:
+        t0 = time.perf_counter()
+        ok = sum(ex.map(lambda i: verify_password("senha-123" if i % 2 else "errada", hashed), range(args.n)))
+        elapsed = time.perf_counter() - t0
+
+    assert ok == args.n // 2
+    report(f"login rounds={PBKDF2_ROUNDS} workers={args.workers}", args.n, elapsed)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import argparse
+import random
+from decimal import Decimal
+
+from bench._common import report, timeit
+from core.money import brl_cents, mul_cents
+
+def brl_float(value: float) -> str:
+    # caminho antigo: float + três replaces encadeados
+    return f"R$ {value:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+def quotes(n: int, lines: int, seed: int = 7):
+    rnd = random.Random(seed)
+    out = []
+    for _ in range(n):
+        out.append([(rnd.randint(1, 200), rnd.randint(1, 500_000)) for _ in range(lines)])  # (qty, centavos)
+    return out
+
+def total_float(q):
+    subtotal = 0.0
+    for qty, cents in q:
+        subtotal += qty * (cents / 100)
+    return subtotal
+
+def total_cents(q):
+    subtotal = 0
+    for qty, cents in q:
+        subtotal += mul_cents(qty, cents)
+    return subtotal
+
+def main():
+    ap = argparse.ArgumentParser(description="Compara o caminho float com o caminho em centavos")
+    ap.add_argument("-n", type=int, default=20_000, help="orçamentos")
+    ap.add_argument("--lines", type=int, default=25, help="linhas por orçamento")
+    args = ap.parse_args()
+
+    qs = quotes(args.n, args.lines)
+
+    # referência exata em Decimal: o caminho em centavos precisa bater sempre
+    float_off = 0
+    for q in qs:
+        ref = sum(Decimal(qty) * Decimal(cents).scaleb(-2) for qty, cents in q)
+        assert Decimal(total_cents(q)).scaleb(-2) == ref
+        # o que o cliente vê: só conta erro quando o texto formatado diverge
+        if brl_float(total_float(q)) != brl_cents(total_cents(q)):
+            float_off += 1
+    print(f"centavos: {args.n}/{args.n} totais exatos | float: {float_off} totais formatados com erro")
+
+    n_lines = args.n * args.lines
+    report("total float", n_lines, timeit(lambda: [total_float(q) for q in qs], repeat=3))
+    report("total centavos", n_lines, timeit(lambda: [total_cents(q) for q in qs], repeat=3))
+
+    floats = [total_float(q) for q in qs]
+    cents = [total_cents(q) for q in qs]
+    report("brl float (3 replaces)", args.n, timeit(lambda: [brl_float(v) for v in floats]))
+    report("brl_cents (divmod + tabelas)", args.n, timeit(lambda: [brl_cents(v) for v in cents]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import argparse
+import math
+import random
+
+from bench._common import report, timeit
+from services.optimizer import plan_run
+
+def jobs(n: int, segments: int, seed: int = 11):
+    rnd = random.Random(seed)
+    out = []
+    for _ in range(n):
+        out.append({
+            "segments": [round(rnd.uniform(1.0, 45.0), 2) for _ in range(rnd.randint(max(1, segments // 2), segments))],
+            "fios": rnd.randint(1, 10),
+            "espac": rnd.choice([1.0, 1.5, 2.0, 2.5, 3.0]),
+        })
+    return out
+
+def formula(job):
+    # o que services.concertina_linear calcula hoje para o mesmo perímetro
+    per = sum(job["segments"])
+    vaos = math.ceil(per / job["espac"])
+    return {"rolls": math.ceil(per * job["fios"] / 20), "hastes": vaos + 1}
+
+def main():
+    ap = argparse.ArgumentParser(description="Plano de corte por trecho vs fórmula do perímetro contínuo")
+    ap.add_argument("-n", type=int, default=50, help="obras")
+    ap.add_argument("--segments", type=int, default=300, help="máximo de trechos por obra")
+    args = ap.parse_args()
+
+    js = jobs(args.n, args.segments)
+    plans = [plan_run(j["segments"], j["fios"], j["espac"]) for j in js]
+    refs = [formula(j) for j in js]
+
+    rolls_plan = sum(p["rolls"] for p in plans)
+    rolls_formula = sum(r["rolls"] for r in refs)
+    posts_plan = sum(p["posts"]["retas"] + p["posts"]["cantos"] for p in plans)
+    posts_formula = sum(r["hastes"] for r in refs)
+    print(f"rolos: plano {rolls_plan} vs fórmula {rolls_formula} ({rolls_plan - rolls_formula:+d}, "
+          f"a fórmula não considera o corte por trecho); sobra {sum(p['waste_m'] for p in plans):,.1f} m")
+    print(f"hastes: plano {posts_plan} vs fórmula {posts_formula} ({posts_plan - posts_formula:+d})")
+
+    report("fórmula (perímetro contínuo)", args.n, timeit(lambda: [formula(j) for j in js]))
+    report("plan_run (corte por trecho)", args.n, timeit(lambda: [plan_run(j["segments"], j["fios"], j["espac"]) for j in js]))
+    big = max(js, key=lambda j: len(j["segments"]) * j["fios"])
+    report(f"plan_run 1 obra ({len(big['segments'])} trechos × {big['fios']} fios)", 1,
+           timeit(lambda: plan_run(big["segments"], big["fios"], big["espac"])))
+
+    # pequeno: o solver exato entra quando há poucos pedaços
+    rnd = random.Random(5)
+    small = [{"segments": [round(rnd.uniform(3.0, 15.0), 2) for _ in range(12)], "fios": 1, "espac": 2.5} for _ in range(200)]
+    exact = sum(plan_run(j["segments"], j["fios"], j["espac"])["method"] == "exact" for j in small)
+    saved = sum(plan_run(j["segments"], j["fios"], j["espac"], exact=False)["rolls"] - plan_run(j["segments"], j["fios"], j["espac"])["rolls"]
+                for j in small)
+    print(f"obras pequenas: exato melhorou {exact} de {len(small)} ({saved} rolos a menos que a heurística)")
+    report("plan_run pequeno (exato)", len(small), timeit(lambda: [plan_run(j["segments"], j["fios"], j["espac"]) for j in small]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+
+from bench._common import latency, sample
+
+# Suíte de regressão contra um Postgres descartável (BENCH_DATABASE_URL).
+# Cria empresas sintéticas com N itens cada, mede p50/p95/p99 e vazão de:
+#   list_items (catálogo inteiro, busca, categoria), upsert_item, get_subscription_status
+#   (cache quente e frio), quote_many (memo limpo e memo quente) e verify_password,
+# e grava um JSON para comparar entre deploys.
+# Só Postgres: o schema usa pg_trgm/unaccent, triggers e unnest, sem equivalente no SQLite.
+#
+#   BENCH_DATABASE_URL=postgresql+psycopg://... python -m bench.suite --sizes 10,1000,10000 --out bench.json
+
+CATEGORIES = ["Postes/Hastes", "Concertina", "Cabos", "Câmeras", "Gravadores", "Fontes", "Acessórios", "Mão de obra"]
+WORDS = ["haste", "cabo", "câmera", "fonte", "conector", "isolador", "concertina", "suporte", "caixa", "gravador",
+         "reforçado", "galvanizado", "inox", "bullet", "dome", "coaxial", "flexível", "dupla", "alta", "tensão"]
+
+def synthetic_items(n: int, seed: int):
+    rnd = random.Random(seed)
+    for i in range(n):
+        yield {
+            "key": f"bench_{i:06d}",
+            "name": " ".join(rnd.sample(WORDS, 3)).capitalize() + f" {i}",
+            "module": "seguranca",
+            "category": rnd.choice(CATEGORIES),
+            "unit": rnd.choice(["un", "m", "rolo", "serv"]),
+            "price_cents": rnd.randint(100, 500_000),
+        }
+
+def git_rev() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+def main():
+    ap = argparse.ArgumentParser(description="Latência e vazão dos caminhos de dados e orçamento por tamanho de catálogo")
+    ap.add_argument("--sizes", default="10,100,1000,10000", help="itens por empresa sintética")
+    ap.add_argument("-n", type=int, default=200, help="amostras por caminho")
+    ap.add_argument("--logins", type=int, default=20, help="amostras de verify_password (caro)")
+    ap.add_argument("--out", default="", help="arquivo JSON de saída (padrão: stdout)")
+    ap.add_argument("--keep", action="store_true", help="não apaga as empresas sintéticas no final")
+    args = ap.parse_args()
+
+    url = os.getenv("BENCH_DATABASE_URL")
+    if not url:
+        sys.exit("BENCH_DATABASE_URL não definido (use um Postgres descartável, nunca o de produção)")
+    if url == os.getenv("DATABASE_URL"):
+        sys.exit("BENCH_DATABASE_URL igual a DATABASE_URL: recusando rodar contra o banco da aplicação")
+    # get_engine lê DATABASE_URL; a suíte nunca toca o banco configurado da aplicação
+    os.environ["DATABASE_URL"] = url
+    os.environ.setdefault("AUTH_HASH_WORKERS", "0")
+
+    from sqlalchemy import text
+    from core.auth import PBKDF2_ROUNDS, hash_password, verify_password
+    from core.db import (bulk_upsert_items, create_user_with_company, get_engine, get_subscription_status, init_db,
+                         invalidate_subscription, list_items, upsert_item, write_conn)
+    from services.engine import clear_quote_cache, quote_many
+
+    engine = get_engine()
+    init_db(engine)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    run = uuid.uuid4().hex[:8]
+    hashed = hash_password("bench-senha")
+    results = []
+    companies = []
+
+    try:
+        for size in sizes:
+            t0 = time.perf_counter()
+            cid = create_user_with_company(engine, f"bench-{run}-{size}@bench.invalid", "Bench", hashed, f"Bench {run} {size}", "")["company_id"]
+            companies.append(cid)
+            bulk_upsert_items(engine, cid, synthetic_items(size, seed=size), chunk_size=1000)
+            print(f"-- empresa {cid}: {size} itens em {time.perf_counter() - t0:.2f} s")
+
+            rnd = random.Random(size)
+            keys = [f"bench_{i:06d}" for i in range(size)]
+            terms = [w[:4] for w in WORDS]
+
+            results.append(latency("list_items", sample(lambda i: list_items(engine, cid), args.n), items=size))
+            results.append(latency("list_items search", sample(lambda i: list_items(engine, cid, search=terms[i % len(terms)]), args.n), items=size))
+            results.append(latency("list_items category", sample(lambda i: list_items(engine, cid, category=CATEGORIES[i % len(CATEGORIES)]), args.n), items=size))
+            results.append(latency("upsert_item", sample(lambda i: upsert_item(
+                engine, cid, rnd.choice(keys), f"Item bench {i}", "seguranca", rnd.choice(CATEGORIES), "un", rnd.randint(100, 500_000)), args.n), items=size))
+
+            results.append(latency("get_subscription_status hot", sample(lambda i: get_subscription_status(engine, cid), args.n), items=size))
+
+            def cold(i):
+                invalidate_subscription(cid)
+                get_subscription_status(engine, cid)
+            results.append(latency("get_subscription_status cold", sample(cold, args.n), items=size))
+
+            # serviços embutidos: uma consulta de preços + compute puro
+            reqs = [("cerca", {"perimetro": 36, "cantos": 4}), ("concertina_linear", {"per": 36, "fios": 6, "cantos": 4}),
+                    ("cftv_install", {"qtd": 4})]
+            # frio: memo limpo a cada amostra (consulta de preços + compute); quente: mesma entrada, só o memo
+            def quote_cold(i):
+                clear_quote_cache()
+                quote_many(engine, cid, reqs)
+            results.append(latency("quote_many (3 serviços) cold", sample(quote_cold, args.n), items=size))
+            results.append(latency("quote_many (3 serviços) memo", sample(lambda i: quote_many(engine, cid, reqs), args.n), items=size))
+
+        results.append(latency(f"verify_password rounds={PBKDF2_ROUNDS}", sample(lambda i: verify_password("bench-senha", hashed), args.logins, warmup=1)))
+    finally:
+        if companies and not args.keep:
+            with write_conn(engine) as c:
+                c.execute(text("DELETE FROM users WHERE email LIKE :p"), {"p": f"bench-{run}-%"})
+                c.execute(text("DELETE FROM companies WHERE id = ANY(:ids)"), {"ids": companies})
+
+    payload = {
+        "run": run,
+        "git": git_rev(),
+        "at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "samples": args.n,
+        "sizes": sizes,
+        "results": results,
+    }
+    out = json.dumps(payload, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as fp:
+            fp.write(out)
+        print(f"resultados em {args.out}")
+    else:
+        print(out)
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,169 @@
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Deque, Dict, Optional, Tuple
+
 from passlib.context import CryptContext
 
+from core.cache import LRUCache, env_float, env_int
+from core.db import get_user_by_email, update_password_hash
+
 # PBKDF2 é bem estável em qualquer ambiente (Railway included)
-pwd = CryptContext(
-    schemes=["pbkdf2_sha256"],
-    default="pbkdf2_sha256",
-    deprecated="auto",
-)
+PBKDF2_ROUNDS = env_int("AUTH_PBKDF2_ROUNDS", 29000)
+# 0 = calcula no próprio thread (útil em dev/testes)
+HASH_WORKERS = env_int("AUTH_HASH_WORKERS", 2)
+HASH_TIMEOUT = env_float("AUTH_HASH_TIMEOUT", 10.0)
 
-def hash_password(p: str) -> str:
-    if p is None:
-        p = ""
-    return pwd.hash(str(p))
+def _make_context(rounds: int) -> CryptContext:
+    # min_rounds = rounds: hashes antigos com menos rounds são refeitos no próximo login
+    return CryptContext(
+        schemes=["pbkdf2_sha256"],
+        default="pbkdf2_sha256",
+        deprecated="auto",
+        pbkdf2_sha256__default_rounds=rounds,
+        pbkdf2_sha256__min_rounds=rounds,
+    )
 
-def verify_password(p: str, hashed: str) -> bool:
+class AuthBusy(RuntimeError):
+    pass
+
+# ---------- WORKERS ----------
+# rodam no processo do pool; o contexto é criado uma vez por worker
+_worker_pwd: Dict[int, CryptContext] = {}
+
+def _worker_context(rounds: int) -> CryptContext:
+    ctx = _worker_pwd.get(rounds)
+    if ctx is None:
+        ctx = _worker_pwd[rounds] = _make_context(rounds)
+    return ctx
+
+def _hash_job(p: str, rounds: int) -> str:
+    return _worker_context(rounds).hash(p)
+
+def _verify_job(p: str, hashed: str, rounds: int) -> Tuple[bool, Optional[str]]:
     try:
-        if p is None:
-            p = ""
-        return pwd.verify(str(p), hashed)
+        return _worker_context(rounds).verify_and_update(p, hashed)
     except Exception:
-        return False
+        return False, None
+
+# ---------- POOL ----------
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+# limita a fila: acima disso o login é recusado em vez de acumular CPU pendente
+_slots = threading.BoundedSemaphore(max(1, HASH_WORKERS) * env_int("AUTH_HASH_QUEUE_PER_WORKER", 4))
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: não herda os threads do servidor Streamlit
+            _pool = ProcessPoolExecutor(max_workers=HASH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+def _submit(fn, *args) -> Future:
+    if HASH_WORKERS <= 0:
+        f: Future = Future()
+        try:
+            f.set_result(fn(*args))
+        except Exception as e:
+            f.set_exception(e)
+        return f
+
+    if not _slots.acquire(timeout=HASH_TIMEOUT):
+        raise AuthBusy("Muitas autenticações em andamento, tente novamente.")
+    try:
+        f = _get_pool().submit(fn, *args)
+    except Exception:
+        _slots.release()
+        raise
+    f.add_done_callback(lambda _: _slots.release())
+    return f
+
+def hash_password_async(p: str) -> Future:
+    return _submit(_hash_job, "" if p is None else str(p), PBKDF2_ROUNDS)
+
+def verify_and_update_async(p: str, hashed: str) -> Future:
+    return _submit(_verify_job, "" if p is None else str(p), hashed, PBKDF2_ROUNDS)
+
+def _result(f: Future) -> Any:
+    # timeout ou pool quebrado viram AuthBusy: falha do servidor, não senha errada
+    try:
+        return f.result(timeout=HASH_TIMEOUT)
+    except Exception as e:
+        raise AuthBusy("Autenticação indisponível no momento, tente novamente.") from e
+
+def hash_password(p: str) -> str:
+    return _result(hash_password_async(p))
+
+def verify_and_update(p: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    # (senha ok, novo hash se os parâmetros mudaram); hash inválido já volta (False, None) do worker
+    return _result(verify_and_update_async(p, hashed))
+
+def verify_password(p: str, hashed: str) -> bool:
+    return verify_and_update(p, hashed)[0]
+
+# ---------- THROTTLE ----------
+# chave vazia (sem X-Forwarded-For, email em branco) cai num balde comum em vez de escapar do limite
+_NO_KEY = "<vazio>"
+
+class LoginThrottle:
+    # janela deslizante de falhas por chave (email ou IP), em memória do processo.
+    # LRU com TTL = janela: chaves ociosas expiram sozinhas e o total de chaves é limitado
+    def __init__(self, max_failures: int, window: float, max_keys: int = 10_000):
+        self.max_failures = max_failures
+        self.window = window
+        self._fails = LRUCache(maxsize=max_keys)
+        self._lock = threading.Lock()
+
+    def _recent(self, key: str, now: float) -> Deque[float]:
+        q = self._fails.get(key or _NO_KEY)
+        if q is None:
+            return deque()
+        while q and q[0] <= now - self.window:
+            q.popleft()
+        return q
+
+    def allowed(self, key: str) -> bool:
+        with self._lock:
+            return len(self._recent(key, time.monotonic())) < self.max_failures
+
+    def fail(self, key: str) -> None:
+        with self._lock:
+            now = time.monotonic()
+            q = self._recent(key, now)
+            q.append(now)
+            self._fails.set(key or _NO_KEY, q, ttl=self.window)
+
+    def reset(self, key: str) -> None:
+        self._fails.pop(key or _NO_KEY)
+
+_window = env_float("AUTH_THROTTLE_WINDOW", 900.0)
+_max_keys = env_int("AUTH_THROTTLE_MAX_KEYS", 10_000)
+email_throttle = LoginThrottle(env_int("AUTH_MAX_FAILURES_PER_EMAIL", 5), _window, _max_keys)
+ip_throttle = LoginThrottle(env_int("AUTH_MAX_FAILURES_PER_IP", 30), _window, _max_keys)
+
+def authenticate(engine, email: str, password: str, ip: str = "") -> Tuple[Optional[Dict[str, Any]], str]:
+    # checagens baratas antes do KDF: limite por IP/email e existência do usuário
+    email_key = (email or "").lower().strip()
+    if not (ip_throttle.allowed(ip) and email_throttle.allowed(email_key)):
+        return None, "throttled"
+
+    u = get_user_by_email(engine, email_key)
+    if not u:
+        ip_throttle.fail(ip)
+        email_throttle.fail(email_key)
+        return None, "invalid"
+
+    # AuthBusy (fila cheia, timeout do pool) sobe sem contar como tentativa errada
+    ok, new_hash = verify_and_update(password, u["password_hash"])
+    if not ok:
+        ip_throttle.fail(ip)
+        email_throttle.fail(email_key)
+        return None, "invalid"
+
+    email_throttle.reset(email_key)
+    if new_hash:
+        update_password_hash(engine, u["id"], new_hash)
+    return u, "ok"
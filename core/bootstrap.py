@@ -0,0 +1,12 @@
+from sqlalchemy.engine import Engine
+
+from core.db import get_engine, init_db
+from core.scheduler import start_scheduler
+
+def bootstrap(background: bool = True) -> Engine:
+    # barato a partir da 2ª chamada: engine, schema e varredura de assinaturas ficam prontos no processo
+    engine = get_engine()
+    init_db(engine)
+    if background:
+        start_scheduler(engine)
+    return engine
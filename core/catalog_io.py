@@ -0,0 +1,105 @@
+import csv
+import io
+import json
+from decimal import InvalidOperation
+from typing import Any, Dict, IO, Iterator, List, Optional, Tuple
+
+from sqlalchemy.engine import Engine
+
+from core.db import bulk_upsert_items, export_items
+from core.money import from_cents, to_cents
+
+# importação/exportação de lista de preços (CSV ou JSONL) para a tabela items
+FORMATS = ("csv", "jsonl")
+# colunas do arquivo; o preço vai em reais ("115.17"), no banco/código em centavos
+FILE_FIELDS = ("key", "name", "module", "category", "unit", "price")
+MAX_REPORTED_ERRORS = 100
+
+class PriceListError(ValueError):
+    pass
+
+def _read_rows(fp: IO[str], fmt: str) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    if fmt == "csv":
+        reader = csv.DictReader(fp)
+        missing = {"key", "name", "price"} - set(reader.fieldnames or [])
+        if missing:
+            raise PriceListError(f"Colunas obrigatórias ausentes: {', '.join(sorted(missing))}")
+        for r in reader:
+            yield reader.line_num, r
+    elif fmt == "jsonl":
+        for n, line in enumerate(fp, start=1):
+            if not line.strip():
+                continue
+            try:
+                r = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise PriceListError(f"linha {n}: JSON inválido ({e.msg})")
+            if not isinstance(r, dict):
+                raise PriceListError(f"linha {n}: esperado um objeto JSON")
+            yield n, r
+    else:
+        raise PriceListError(f"Formato não suportado: {fmt}")
+
+def validate_row(r: Dict[str, Any]) -> Dict[str, Any]:
+    key = str(r.get("key") or "").strip()
+    name = str(r.get("name") or "").strip()
+    if not key:
+        raise PriceListError("chave vazia")
+    if not name:
+        raise PriceListError("nome vazio")
+
+    # to_cents aceita vírgula decimal (ex: 115,17) vinda de planilhas em pt-BR
+    raw = r.get("price")
+    try:
+        price_cents = to_cents("" if raw is None else raw)
+    except (InvalidOperation, ValueError):
+        raise PriceListError(f"preço inválido: {raw!r}")
+    if price_cents < 0:
+        raise PriceListError(f"preço inválido: {raw!r}")
+
+    return {
+        "key": key,
+        "name": name,
+        "module": str(r.get("module") or "seguranca").strip(),
+        "category": str(r.get("category") or "").strip(),
+        "unit": str(r.get("unit") or "un").strip(),
+        "price_cents": price_cents,
+    }
+
+def import_price_list(engine: Engine, company_id: int, fp: IO[str], fmt: str = "csv", chunk_size: int = 500) -> Dict[str, Any]:
+    # linhas inválidas são puladas e reportadas; as válidas entram em lotes
+    errors: List[str] = []
+    invalid = 0
+
+    def valid_rows() -> Iterator[Dict[str, Any]]:
+        nonlocal invalid
+        for n, r in _read_rows(fp, fmt):
+            try:
+                yield validate_row(r)
+            except PriceListError as e:
+                invalid += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append(f"linha {n}: {e}")
+
+    counts = bulk_upsert_items(engine, company_id, valid_rows(), chunk_size=chunk_size)
+    return {**counts, "invalid": invalid, "errors": errors}
+
+def export_price_list(engine: Engine, company_id: int, fmt: str = "csv", module: Optional[str] = None) -> Iterator[str]:
+    if fmt not in FORMATS:
+        raise PriceListError(f"Formato não suportado: {fmt}")
+
+    if fmt == "csv":
+        buf = io.StringIO()
+        w = csv.writer(buf)
+        w.writerow(FILE_FIELDS)
+        for r in export_items(engine, company_id, module=module):
+            w.writerow([r["key"], r["name"], r["module"], r["category"], r["unit"], from_cents(r["price_cents"])])
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+        yield buf.getvalue()
+    else:
+        for r in export_items(engine, company_id, module=module):
+            row = {f: r[f] for f in FILE_FIELDS[:-1]}
+            row["price"] = str(from_cents(r["price_cents"]))
+            yield json.dumps(row, ensure_ascii=False) + "\n"
@@ -1,133 +1,213 @@
+import hashlib
 import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import datetime, timedelta, timezone
-from typing import Optional, List, Dict, Any
+from decimal import Decimal
+from typing import Optional, List, Dict, Any, Iterable, Iterator, Tuple
 
 from sqlalchemy import create_engine, text
-from sqlalchemy.engine import Engine
+from sqlalchemy.engine import Connection, Engine
+
+from core import instrument
+from core.cache import LRUCache, env_float, env_int
+from core.migrations import migrate
+from core.money import Cents, from_cents, to_cents
+from core.utils import fold
+
+_engine: Optional[Engine] = None
+_engine_lock = threading.Lock()
+_schema_lock = threading.Lock()
+_schema_ready = False
 
 def get_engine() -> Engine:
-    url = os.getenv("DATABASE_URL")
-    if not url:
-        raise RuntimeError("DATABASE_URL não definido (crie um Postgres no Railway).")
-    # Railway geralmente fornece postgres://, SQLAlchemy prefere postgresql://
-    if url.startswith("postgres://"):
-        url = url.replace("postgres://", "postgresql://", 1)
-    return create_engine(url, pool_pre_ping=True)
+    # um engine (e um pool) por processo; o Streamlit reexecuta o app a cada interação
+    global _engine
+    if _engine is not None:
+        return _engine
+    with _engine_lock:
+        if _engine is None:
+            url = os.getenv("DATABASE_URL")
+            if not url:
+                raise RuntimeError("DATABASE_URL não definido (crie um Postgres no Railway).")
+            # Railway geralmente fornece postgres://, SQLAlchemy prefere postgresql://
+            if url.startswith("postgres://"):
+                url = url.replace("postgres://", "postgresql://", 1)
+            _engine = create_engine(
+                url,
+                pool_pre_ping=True,
+                pool_size=env_int("DB_POOL_SIZE", 5),
+                max_overflow=env_int("DB_MAX_OVERFLOW", 10),
+                pool_recycle=env_int("DB_POOL_RECYCLE", 1800),
+                pool_timeout=env_float("DB_POOL_TIMEOUT", 30.0),
+            )
+            instrument.install(_engine)
+    return _engine
+
+# ---------- CONNECTIONS ----------
+# unit of work: uma conexão por render; os helpers abaixo a reutilizam quando ativa
+_uow: ContextVar[Optional[Connection]] = ContextVar("db_unit_of_work", default=None)
+_pool_wait = {"checkouts": 0, "wait_total": 0.0, "wait_max": 0.0}
+_pool_wait_lock = threading.Lock()
+
+@contextmanager
+def _checkout(engine: Engine) -> Iterator[Connection]:
+    t0 = time.perf_counter()
+    c = engine.connect()
+    waited = time.perf_counter() - t0
+    with _pool_wait_lock:
+        _pool_wait["checkouts"] += 1
+        _pool_wait["wait_total"] += waited
+        _pool_wait["wait_max"] = max(_pool_wait["wait_max"], waited)
+    try:
+        yield c
+    finally:
+        c.close()
+
+@contextmanager
+def read_conn(engine: Engine) -> Iterator[Connection]:
+    # leitura pura: AUTOCOMMIT, sem BEGIN/COMMIT
+    c = _uow.get()
+    if c is not None:
+        yield c
+        return
+    with _checkout(engine) as c:
+        c.execution_options(isolation_level="AUTOCOMMIT")
+        yield c
+
+@contextmanager
+def write_conn(engine: Engine) -> Iterator[Connection]:
+    # escrita: transação própria, commit ao sair do bloco
+    c = _uow.get()
+    if c is not None:
+        # a conexão do unit of work fica em AUTOCOMMIT; só o bloco de escrita roda em transação.
+        # as leituras anteriores deixaram o autobegin do SQLAlchemy aberto (sem BEGIN no banco):
+        # é preciso encerrá-lo antes de trocar o isolation_level
+        if c.in_transaction():
+            c.commit()
+        c.execution_options(isolation_level=c.default_isolation_level)
+        try:
+            with c.begin():
+                yield c
+        finally:
+            c.execution_options(isolation_level="AUTOCOMMIT")
+        return
+    with _checkout(engine) as c:
+        with c.begin():
+            yield c
+
+@contextmanager
+def unit_of_work(engine: Engine) -> Iterator[Connection]:
+    # todas as consultas do bloco usam a mesma conexão do pool (reentrante)
+    current = _uow.get()
+    if current is not None:
+        yield current
+        return
+    with _checkout(engine) as c:
+        # leituras em AUTOCOMMIT como no read_conn: nenhuma transação aberta entre as consultas do rerun
+        c.execution_options(isolation_level="AUTOCOMMIT")
+        token = _uow.set(c)
+        try:
+            yield c
+        finally:
+            _uow.reset(token)
+
+def pool_stats(engine: Engine) -> Dict[str, Any]:
+    pool = engine.pool
+    with _pool_wait_lock:
+        waits = dict(_pool_wait)
+    out: Dict[str, Any] = {"status": pool.status()}
+    # QueuePool expõe os contadores; outros pools (ex: NullPool) só o status
+    for name in ("size", "checkedout", "checkedin", "overflow"):
+        fn = getattr(pool, name, None)
+        if fn is not None:
+            out[name] = fn()
+    out["checkouts"] = waits["checkouts"]
+    out["wait_max_ms"] = waits["wait_max"] * 1000
+    out["wait_avg_ms"] = waits["wait_total"] * 1000 / waits["checkouts"] if waits["checkouts"] else 0.0
+    return out
 
 def now_utc():
     return datetime.now(timezone.utc)
 
 def init_db(engine: Engine) -> None:
-    with engine.begin() as c:
-        c.execute(text("""
-        CREATE TABLE IF NOT EXISTS users (
-            id BIGSERIAL PRIMARY KEY,
-            email TEXT UNIQUE NOT NULL,
-            name TEXT NOT NULL,
-            password_hash TEXT NOT NULL,
-            created_at TIMESTAMPTZ NOT NULL DEFAULT now()
-        );
-        """))
-        c.execute(text("""
-        CREATE TABLE IF NOT EXISTS companies (
-            id BIGSERIAL PRIMARY KEY,
-            name TEXT NOT NULL,
-            whatsapp TEXT DEFAULT '',
-            created_at TIMESTAMPTZ NOT NULL DEFAULT now()
-        );
-        """))
-        c.execute(text("""
-        CREATE TABLE IF NOT EXISTS memberships (
-            user_id BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-            company_id BIGINT NOT NULL REFERENCES companies(id) ON DELETE CASCADE,
-            role TEXT NOT NULL DEFAULT 'admin',
-            PRIMARY KEY (user_id, company_id)
-        );
-        """))
-        c.execute(text("""
-        CREATE TABLE IF NOT EXISTS plans (
-            id BIGSERIAL PRIMARY KEY,
-            code TEXT UNIQUE NOT NULL,
-            name TEXT NOT NULL,
-            price_monthly_cents INT NOT NULL DEFAULT 0,
-            max_users INT NOT NULL DEFAULT 1,
-            created_at TIMESTAMPTZ NOT NULL DEFAULT now()
-        );
-        """))
-        c.execute(text("""
-        CREATE TABLE IF NOT EXISTS subscriptions (
-            company_id BIGINT PRIMARY KEY REFERENCES companies(id) ON DELETE CASCADE,
-            plan_id BIGINT NOT NULL REFERENCES plans(id),
-            status TEXT NOT NULL DEFAULT 'trial', -- trial|active|past_due|canceled
-            current_period_end TIMESTAMPTZ NOT NULL,
-            created_at TIMESTAMPTZ NOT NULL DEFAULT now()
-        );
-        """))
-        c.execute(text("""
-        CREATE TABLE IF NOT EXISTS items (
-            id BIGSERIAL PRIMARY KEY,
-            company_id BIGINT NOT NULL REFERENCES companies(id) ON DELETE CASCADE,
-            key TEXT NOT NULL,
-            name TEXT NOT NULL,
-            module TEXT NOT NULL DEFAULT 'seguranca',
-            category TEXT NOT NULL DEFAULT '',
-            unit TEXT NOT NULL DEFAULT 'un',
-            price NUMERIC(12,2) NOT NULL DEFAULT 0,
-            active BOOLEAN NOT NULL DEFAULT TRUE,
-            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
-            UNIQUE(company_id, key)
-        );
-        """))
-
-    seed_plans(engine)
-
-def seed_plans(engine: Engine) -> None:
-    with engine.begin() as c:
-        # cria planos básicos se não existirem
-        c.execute(text("""
-        INSERT INTO plans (code, name, price_monthly_cents, max_users)
-        VALUES
-          ('basic', 'Básico', 2900, 1),
-          ('pro', 'Pro', 5900, 3),
-          ('agency', 'Agência', 9900, 10)
-        ON CONFLICT (code) DO NOTHING;
-        """))
+    # aplica as migrações pendentes uma única vez por processo
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if _schema_ready:
+            return
+        with write_conn(engine) as c:
+            migrate(c)
+        _schema_ready = True
 
 # ---------- USERS / AUTH ----------
-def create_user_with_company(engine: Engine, email: str, name: str, password_hash: str, company_name: str, whatsapp: str) -> Dict[str, Any]:
+def provision_tenant(engine: Engine, email: str, name: str, password_hash: str, company_name: str, whatsapp: str) -> Optional[Dict[str, Any]]:
+    # usuário, empresa, vínculo e assinatura trial num único comando (um round-trip, um commit).
+    # O catálogo vem do base_items por herança, nada é copiado (só os agregados item_rollups são
+    # gravados aqui). None = email já cadastrado.
     trial_days = int(os.getenv("TRIAL_DAYS", "7"))
     end = now_utc() + timedelta(days=trial_days)
 
-    with engine.begin() as c:
-        u = c.execute(text("""
-            INSERT INTO users (email, name, password_hash)
-            VALUES (:email, :name, :ph)
-            RETURNING id;
-        """), {"email": email.lower().strip(), "name": name.strip(), "ph": password_hash}).fetchone()
-        user_id = int(u[0])
-
-        co = c.execute(text("""
-            INSERT INTO companies (name, whatsapp)
-            VALUES (:name, :whatsapp)
-            RETURNING id;
-        """), {"name": company_name.strip(), "whatsapp": whatsapp.strip()}).fetchone()
-        company_id = int(co[0])
-
-        c.execute(text("""
-            INSERT INTO memberships (user_id, company_id, role)
-            VALUES (:u, :c, 'admin');
-        """), {"u": user_id, "c": company_id})
+    with write_conn(engine) as c:
+        row = c.execute(text("""
+            WITH p AS (
+                SELECT id FROM plans WHERE code='basic'
+            ), u AS (
+                -- sem o plano do trial nada é criado (e a linha final diz por quê)
+                INSERT INTO users (email, name, password_hash)
+                SELECT :email, :name, :ph FROM p
+                ON CONFLICT (email) DO NOTHING
+                RETURNING id
+            ), co AS (
+                INSERT INTO companies (name, whatsapp)
+                SELECT :company, :whatsapp FROM u
+                RETURNING id
+            ), m AS (
+                INSERT INTO memberships (user_id, company_id, role)
+                SELECT u.id, co.id, 'admin' FROM u, co
+            ), s AS (
+                INSERT INTO subscriptions (company_id, plan_id, status, current_period_end)
+                SELECT co.id, p.id, 'trial', :end FROM co, p
+            ), r AS (
+                -- agregados do Dashboard já na criação: o catálogo da empresa nova é exatamente o base
+                INSERT INTO item_rollups (company_id, category, item_count, price_sum, price_min, price_max)
+                SELECT co.id, b.category, count(*), sum(b.price), min(b.price), max(b.price)
+                FROM co, base_items b
+                WHERE b.active
+                GROUP BY co.id, b.category
+            )
+            SELECT (SELECT id FROM p), u.id, co.id
+            FROM (SELECT 1) one LEFT JOIN u ON true LEFT JOIN co ON true
+        """), {
+            "email": email.lower().strip(), "name": name.strip(), "ph": password_hash,
+            "company": company_name.strip(), "whatsapp": whatsapp.strip(), "end": end,
+        }).fetchone()
 
-        plan_id = c.execute(text("SELECT id FROM plans WHERE code='basic'")).fetchone()[0]
-        c.execute(text("""
-            INSERT INTO subscriptions (company_id, plan_id, status, current_period_end)
-            VALUES (:cid, :pid, 'trial', :end);
-        """), {"cid": company_id, "pid": int(plan_id), "end": end})
+    if row[0] is None:
+        raise RuntimeError("Plano 'basic' não cadastrado: rode as migrações (core.migrations) antes de criar contas.")
+    if row[1] is None:
+        return None
+    user_id, company_id = int(row[1]), int(row[2])
+    return {
+        "user_id": user_id,
+        "company_id": company_id,
+        "user": {"id": user_id, "email": email.lower().strip(), "name": name.strip()},
+        "membership": {"company_id": company_id, "company_name": company_name.strip(), "whatsapp": whatsapp.strip(), "role": "admin"},
+    }
 
-    return {"user_id": user_id, "company_id": company_id}
+def create_user_with_company(engine: Engine, email: str, name: str, password_hash: str, company_name: str, whatsapp: str) -> Dict[str, Any]:
+    res = provision_tenant(engine, email, name, password_hash, company_name, whatsapp)
+    if res is None:
+        raise ValueError(f"email já cadastrado: {email}")
+    return res
 
 def get_user_by_email(engine: Engine, email: str) -> Optional[Dict[str, Any]]:
-    with engine.begin() as c:
+    with read_conn(engine) as c:
         row = c.execute(text("""
             SELECT id, email, name, password_hash
             FROM users
@@ -137,24 +217,125 @@ def get_user_by_email(engine: Engine, email: str) -> Optional[Dict[str, Any]]:
             return None
         return {"id": int(row[0]), "email": row[1], "name": row[2], "password_hash": row[3]}
 
-def get_membership_company(engine: Engine, user_id: int) -> Optional[Dict[str, Any]]:
-    with engine.begin() as c:
-        row = c.execute(text("""
+def update_password_hash(engine: Engine, user_id: int, password_hash: str) -> None:
+    with write_conn(engine) as c:
+        c.execute(text("UPDATE users SET password_hash=:ph WHERE id=:u"), {"ph": password_hash, "u": user_id})
+
+def list_memberships(engine: Engine, user_id: int) -> List[Dict[str, Any]]:
+    # todas as empresas do usuário numa consulta; a sessão guarda a lista para trocar de empresa sem novo login
+    with read_conn(engine) as c:
+        rows = c.execute(text("""
             SELECT c.id, c.name, c.whatsapp, m.role
             FROM memberships m
             JOIN companies c ON c.id = m.company_id
             WHERE m.user_id=:u
             ORDER BY c.id
-            LIMIT 1
-        """), {"u": user_id}).fetchone()
+        """), {"u": user_id}).fetchall()
+    return [{"company_id": int(r[0]), "company_name": r[1], "whatsapp": r[2], "role": r[3]} for r in rows]
+
+def get_membership_company(engine: Engine, user_id: int) -> Optional[Dict[str, Any]]:
+    mems = list_memberships(engine, user_id)
+    return mems[0] if mems else None
+
+class MembershipError(ValueError):
+    pass
+
+def list_members(engine: Engine, company_id: int) -> List[Dict[str, Any]]:
+    with read_conn(engine) as c:
+        rows = c.execute(text("""
+            SELECT u.id, u.name, u.email, m.role
+            FROM memberships m
+            JOIN users u ON u.id = m.user_id
+            WHERE m.company_id=:cid
+            ORDER BY u.name
+        """), {"cid": company_id}).fetchall()
+    return [{"user_id": int(r[0]), "name": r[1], "email": r[2], "role": r[3]} for r in rows]
+
+# convite vale por N dias; depois não é mais aceito e libera a vaga
+INVITE_TTL_DAYS = env_int("INVITE_TTL_DAYS", 7)
+
+def _invite_hash(code: str) -> str:
+    return hashlib.sha256(code.strip().encode("utf-8")).hexdigest()
+
+def add_member(engine: Engine, company_id: int, email: str, role: str = "member") -> Dict[str, Any]:
+    # convite com código de uso único: não consulta contas (sem enumeração de emails) e o vínculo só
+    # nasce quando alguém logado resgata o código, que o admin entrega à pessoa por fora.
+    # respeita plans.max_users contando membros + convites pendentes; FOR UPDATE na empresa serializa
+    email = email.lower().strip()
+    if "@" not in email:
+        raise MembershipError("Informe um email válido.")
+    with write_conn(engine) as c:
+        row = c.execute(text("""
+            SELECT p.max_users
+            FROM companies co
+            JOIN subscriptions s ON s.company_id = co.id
+            JOIN plans p ON p.id = s.plan_id
+            WHERE co.id=:cid
+            FOR UPDATE OF co
+        """), {"cid": company_id}).fetchone()
+        if not row:
+            raise MembershipError("Empresa sem plano ativo.")
+        max_users = int(row[0])
+
+        params = {"cid": company_id, "e": email, "ttl": INVITE_TTL_DAYS}
+        # convite vencido ou anterior para o mesmo email não ocupa vaga
+        c.execute(text("""
+            DELETE FROM member_invites
+            WHERE company_id=:cid AND (email=:e OR created_at <= now() - make_interval(days => :ttl))
+        """), params)
+        # contagens pelo memberships_company_idx e pelo member_invites_company_idx
+        seats = int(c.execute(text("""
+            SELECT (SELECT count(*) FROM memberships WHERE company_id=:cid)
+                 + (SELECT count(*) FROM member_invites WHERE company_id=:cid)
+        """), params).scalar())
+        if seats >= max_users:
+            raise MembershipError(f"Limite do plano atingido ({max_users} usuários).")
+
+        code = secrets.token_urlsafe(16)
+        c.execute(text("""
+            INSERT INTO member_invites (token_hash, company_id, email, role)
+            VALUES (:h, :cid, :e, :role)
+        """), {**params, "h": _invite_hash(code), "role": role})
+    # o código só existe aqui: o banco guarda o hash
+    return {"email": email, "role": role, "code": code}
+
+def list_invites(engine: Engine, company_id: int) -> List[Dict[str, Any]]:
+    # convites pendentes da empresa (o email é a etiqueta digitada pelo admin)
+    with read_conn(engine) as c:
+        rows = c.execute(text("""
+            SELECT email, role, created_at
+            FROM member_invites
+            WHERE company_id=:cid AND created_at > now() - make_interval(days => :ttl)
+            ORDER BY created_at
+        """), {"cid": company_id, "ttl": INVITE_TTL_DAYS}).fetchall()
+    return [{"email": r[0], "role": r[1], "created_at": r[2]} for r in rows]
+
+def redeem_invite(engine: Engine, user_id: int, code: str) -> Optional[int]:
+    # consome o código e cria o vínculo (a vaga foi reservada no add_member); None = inválido/vencido
+    with write_conn(engine) as c:
+        row = c.execute(text("""
+            DELETE FROM member_invites
+            WHERE token_hash=:h AND created_at > now() - make_interval(days => :ttl)
+            RETURNING company_id, role
+        """), {"h": _invite_hash(code), "ttl": INVITE_TTL_DAYS}).fetchone()
         if not row:
             return None
-        return {"company_id": int(row[0]), "company_name": row[1], "whatsapp": row[2], "role": row[3]}
+        c.execute(text("""
+            INSERT INTO memberships (user_id, company_id, role)
+            VALUES (:u, :cid, :role)
+            ON CONFLICT (user_id, company_id) DO NOTHING
+        """), {"u": user_id, "cid": int(row[0]), "role": row[1]})
+    return int(row[0])
 
-def get_subscription_status(engine: Engine, company_id: int) -> Dict[str, Any]:
-    with engine.begin() as c:
+# status da assinatura por empresa; o TTL nunca ultrapassa current_period_end
+_subscription_cache = LRUCache(maxsize=env_int("SUBSCRIPTION_CACHE_SIZE", 1024))
+SUBSCRIPTION_CACHE_TTL = env_float("SUBSCRIPTION_CACHE_TTL", 60.0)
+
+def _load_subscription_status(engine: Engine, company_id: int) -> Dict[str, Any]:
+    with read_conn(engine) as c:
         row = c.execute(text("""
-            SELECT s.status, s.current_period_end, p.code, p.name, p.max_users
+            SELECT s.status, s.current_period_end, p.code, p.name, p.max_users,
+                   s.is_active AND s.current_period_end > now()
             FROM subscriptions s
             JOIN plans p ON p.id = s.plan_id
             WHERE s.company_id=:cid
@@ -169,38 +350,254 @@ def get_subscription_status(engine: Engine, company_id: int) -> Dict[str, Any]:
     plan_name = row[3]
     max_users = int(row[4])
 
-    active = (status in ("trial", "active")) and (end is None or end > now_utc())
+    # is_active é mantido por trigger e pela varredura (core.scheduler); o vencimento
+    # ainda é conferido na mesma linha para bloquear antes da próxima varredura
+    active = bool(row[5])
     return {"active": active, "status": status, "period_end": end, "plan": plan_code, "plan_name": plan_name, "max_users": max_users}
 
+def get_subscription_status(engine: Engine, company_id: int) -> Dict[str, Any]:
+    sub = _subscription_cache.get(company_id)
+    if sub is not None:
+        return dict(sub)
+
+    sub = _load_subscription_status(engine, company_id)
+    ttl = SUBSCRIPTION_CACHE_TTL
+    end = sub.get("period_end")
+    if sub["active"] and end is not None:
+        # expira junto com o período, para bloquear no segundo certo
+        ttl = min(ttl, max(0.0, (end - now_utc()).total_seconds()))
+    _subscription_cache.set(company_id, sub, ttl=ttl)
+    return dict(sub)
+
+def invalidate_subscription(company_id: int) -> None:
+    _subscription_cache.pop(company_id)
+
+# ---------- PRICES ----------
+# mapa key -> preço unitário em centavos, resolvido numa única consulta por orçamento
+PriceMap = Dict[str, Cents]
+
+def resolve_prices(engine: Engine, company_id: int, keys: Iterable[str], at: Optional[datetime] = None) -> PriceMap:
+    # at=None: preço atual (items.price); at=T: preço vigente em T, pelo histórico
+    keys = sorted(set(keys))
+    if not keys:
+        return {}
+
+    with read_conn(engine) as c:
+        if at is None:
+            rows = c.execute(text("""
+                SELECT key, price
+                FROM tenant_items(:cid)
+                WHERE key = ANY(:keys) AND active=true
+            """), {"cid": company_id, "keys": keys}).fetchall()
+        else:
+            # um index seek em item_prices_lookup_idx por key; sem histórico da empresa, vale o catálogo base
+            rows = c.execute(text("""
+                SELECT k.key, COALESCE(p.price, b.price)
+                FROM unnest(CAST(:keys AS text[])) AS k(key)
+                LEFT JOIN LATERAL (
+                    SELECT price
+                    FROM item_prices
+                    WHERE company_id=:cid AND key=k.key AND effective_from <= :at
+                    ORDER BY effective_from DESC, id DESC
+                    LIMIT 1
+                ) p ON true
+                LEFT JOIN base_items b ON b.key = k.key AND b.active
+                WHERE p.price IS NOT NULL OR b.key IS NOT NULL
+            """), {"cid": company_id, "keys": keys, "at": at}).fetchall()
+
+    # itens sem cadastro entram com preço 0 (mesmo comportamento do orçamento CFTV)
+    prices = {k: 0 for k in keys}
+    for r in rows:
+        prices[r[0]] = to_cents(r[1])
+    return prices
+
+def price_history(engine: Engine, company_id: int, key: str, limit: int = 50) -> List[Dict[str, Any]]:
+    with read_conn(engine) as c:
+        rows = c.execute(text("""
+            (SELECT price, effective_from
+             FROM item_prices
+             WHERE company_id=:cid AND key=:k
+             ORDER BY effective_from DESC, id DESC
+             LIMIT :lim)
+            UNION ALL
+            -- item herdado e nunca alterado pela empresa: só o preço do catálogo base
+            SELECT price, created_at
+            FROM base_items
+            WHERE key=:k AND NOT EXISTS (SELECT 1 FROM item_prices WHERE company_id=:cid AND key=:k)
+        """), {"cid": company_id, "k": key, "lim": limit}).fetchall()
+    return [{"price_cents": to_cents(r[0]), "effective_from": r[1]} for r in rows]
+
 # ---------- ITEMS ----------
-def list_items(engine: Engine, company_id: int, module: str = "seguranca", category: Optional[str] = None, search: str = "") -> List[Dict[str, Any]]:
-    where = "company_id=:cid AND module=:m AND active=true"
-    params = {"cid": company_id, "m": module}
+# catálogo ativo por (company_id, module); os filtros de categoria/busca rodam em memória
+# cada entrada guarda a companies.catalog_version em que foi lida; versão nova no banco = recarrega
+_catalog_cache = LRUCache(maxsize=env_int("CATALOG_CACHE_SIZE", 256))
+# a versão em si fica em cache por poucos segundos: digitar na busca não consulta o banco a cada tecla,
+# e uma escrita em outro processo aparece aqui em no máximo CATALOG_VERSION_TTL segundos
+_catalog_version_cache = LRUCache(maxsize=env_int("CATALOG_CACHE_SIZE", 256))
+CATALOG_VERSION_TTL = env_float("CATALOG_VERSION_TTL", 2.0)
+# acima disso o catálogo não fica em memória e a busca usa o índice trigram do Postgres
+CATALOG_CACHE_MAX_ROWS = env_int("CATALOG_CACHE_MAX_ROWS", 5000)
+
+def _item_row(r) -> Dict[str, Any]:
+    return {"key": r[0], "name": r[1], "category": r[2], "unit": r[3], "price_cents": to_cents(r[4])}
+
+def _load_catalog(engine: Engine, company_id: int, module: str) -> Optional[List[Tuple[Dict[str, Any], str, str]]]:
+    with read_conn(engine) as c:
+        rows = c.execute(text("""
+            SELECT key, name, category, unit, price
+            FROM tenant_items(:cid)
+            WHERE module=:m AND active=true
+            ORDER BY category, name, key
+            LIMIT :lim
+        """), {"cid": company_id, "m": module, "lim": CATALOG_CACHE_MAX_ROWS + 1}).fetchall()
+
+    if len(rows) > CATALOG_CACHE_MAX_ROWS:
+        return None
+    # guarda nome/key já normalizados para a busca sem acento
+    return [(it, fold(it["name"]), fold(it["key"])) for it in map(_item_row, rows)]
+
+def _get_catalog(engine: Engine, company_id: int, module: str, version: Optional[int] = None) -> Optional[List[Tuple[Dict[str, Any], str, str]]]:
+    # version: quem já leu catalog_version (ex.: a chave do memo de orçamentos) passa a mesma leitura
+    if version is None:
+        version = _cached_catalog_version(engine, company_id)
+    entry = _catalog_cache.get((company_id, module))
+    if entry is not None and entry[0] == version:
+        catalog = entry[1]
+    else:
+        # a versão foi lida antes da carga: se uma escrita entrar no meio, a entrada fica com a versão
+        # antiga e a próxima leitura da versão nova recarrega
+        catalog = _load_catalog(engine, company_id, module)
+        if catalog is None:
+            catalog = False
+        _catalog_cache.set((company_id, module), (version, catalog))
+    return None if catalog is False else catalog
+
+def _bump_catalog_version(c, company_id: int) -> None:
+    # na mesma transação da escrita: quem ler a versão nova já enxerga os preços novos
+    c.execute(text("UPDATE companies SET catalog_version = catalog_version + 1 WHERE id=:cid"), {"cid": company_id})
+
+def catalog_version(engine: Engine, company_id: int) -> int:
+    # leitura direta (uma busca pela PK): chaves de memo de orçamento nunca usam versão velha
+    with read_conn(engine) as c:
+        v = int(c.execute(text("SELECT catalog_version FROM companies WHERE id=:cid"), {"cid": company_id}).scalar() or 0)
+    _catalog_version_cache.set(company_id, v, ttl=CATALOG_VERSION_TTL)
+    return v
+
+def _cached_catalog_version(engine: Engine, company_id: int) -> int:
+    # só para a busca/listagem do catálogo: até CATALOG_VERSION_TTL segundos de atraso entre processos
+    v = _catalog_version_cache.get(company_id)
+    return catalog_version(engine, company_id) if v is None else v
+
+def invalidate_catalog(company_id: int) -> None:
+    # chamado depois do commit: neste processo a escrita aparece na hora; nos outros, pela versão
+    # o módulo de um item pode mudar no upsert, então invalida todos os módulos da empresa
+    _catalog_version_cache.pop(company_id)
+    _catalog_cache.pop_where(lambda k: k[0] == company_id)
+
+def _match_rank(name: str, key: str, q: str) -> Optional[int]:
+    # 0 = exato, 1 = prefixo, 2 = início de palavra, 3 = em qualquer posição
+    if name == q or key == q:
+        return 0
+    if name.startswith(q) or key.startswith(q):
+        return 1
+    if f" {q}" in name or f"_{q}" in key:
+        return 2
+    if q in name or q in key:
+        return 3
+    return None
+
+def _like_escape(s: str) -> str:
+    return s.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def _search_items_db(engine: Engine, company_id: int, module: str, category: Optional[str], q: str, limit: Optional[int], offset: int,
+                     after: Optional[Tuple[str, str, str]] = None, keyset: bool = False) -> List[Dict[str, Any]]:
+    # keyset=True: paginação por (category, name, key), sem ranking de relevância
+    where = "module=:m AND active=true"
+    params: Dict[str, Any] = {"cid": company_id, "m": module, "lim": limit, "off": offset}
+    order = "category, name, key"
 
     if category:
         where += " AND category=:cat"
         params["cat"] = category
 
-    if search:
-        where += " AND (name ILIKE :q OR key ILIKE :q)"
-        params["q"] = f"%{search}%"
+    if after is not None:
+        where += " AND (category, name, key) > (:ac, :an, :ak)"
+        params.update({"ac": after[0], "an": after[1], "ak": after[2]})
+
+    if q:
+        # mesma expressão do items_search_trgm_idx, para o planner usar o índice
+        where += " AND f_unaccent(lower(name || ' ' || key)) LIKE :like"
+        params["like"] = f"%{_like_escape(q)}%"
+        if not keyset:
+            params["q"] = q
+            order = "similarity(f_unaccent(lower(name || ' ' || key)), :q) DESC, category, name, key"
 
-    with engine.begin() as c:
+    with read_conn(engine) as c:
         rows = c.execute(text(f"""
             SELECT key, name, category, unit, price
-            FROM items
+            FROM tenant_items(:cid)
             WHERE {where}
-            ORDER BY category, name
+            ORDER BY {order}
+            LIMIT :lim OFFSET :off
         """), params).fetchall()
+    return [_item_row(r) for r in rows]
 
-    out = []
-    for r in rows:
-        out.append({"key": r[0], "name": r[1], "category": r[2], "unit": r[3], "price": float(r[4])})
-    return out
+def list_items(engine: Engine, company_id: int, module: str = "seguranca", category: Optional[str] = None, search: str = "", limit: Optional[int] = None, offset: int = 0,
+               version: Optional[int] = None) -> List[Dict[str, Any]]:
+    q = fold(search).strip()
+    catalog = _get_catalog(engine, company_id, module, version)
+    if catalog is None:
+        return _search_items_db(engine, company_id, module, category, q, limit, offset)
 
-def upsert_item(engine: Engine, company_id: int, key: str, name: str, module: str, category: str, unit: str, price: float) -> None:
-    with engine.begin() as c:
-        c.execute(text("""
+    hits = []
+    for it, name, key in catalog:
+        if category and it["category"] != category:
+            continue
+        rank = _match_rank(name, key, q) if q else 0
+        if rank is None:
+            continue
+        hits.append((rank, it))
+
+    # sort estável: dentro do mesmo rank mantém a ordem (category, name)
+    if q:
+        hits.sort(key=lambda h: h[0])
+    end = None if limit is None else offset + limit
+    return [dict(it) for _, it in hits[offset:end]]
+
+def list_items_page(engine: Engine, company_id: int, module: str = "seguranca", category: Optional[str] = None, search: str = "",
+                    after: Optional[Tuple[str, str, str]] = None, limit: int = 50) -> Tuple[List[Dict[str, Any]], Optional[Tuple[str, str, str]]]:
+    # página ordenada por (category, name, key); devolve o cursor da próxima página (ou None)
+    q = fold(search).strip()
+    catalog = _get_catalog(engine, company_id, module)
+    if catalog is None:
+        page = _search_items_db(engine, company_id, module, category, q, limit + 1, 0, after=after, keyset=True)
+    else:
+        # o catálogo em memória já vem na ordem do banco; o cursor vira uma posição
+        start = 0
+        if after is not None:
+            start = next((i + 1 for i, (it, _, _) in enumerate(catalog) if it["key"] == after[2]), None)
+            if start is None:
+                start = next((i for i, (it, _, _) in enumerate(catalog) if (it["category"], it["name"], it["key"]) > after), len(catalog))
+        page = []
+        for it, name, key in catalog[start:]:
+            if category and it["category"] != category:
+                continue
+            if q and _match_rank(name, key, q) is None:
+                continue
+            page.append(dict(it))
+            if len(page) > limit:
+                break
+
+    more = len(page) > limit
+    page = page[:limit]
+    cursor = (page[-1]["category"], page[-1]["name"], page[-1]["key"]) if more else None
+    return page, cursor
+
+def upsert_item(engine: Engine, company_id: int, key: str, name: str, module: str, category: str, unit: str, price_cents: Cents) -> None:
+    with write_conn(engine) as c:
+        _lock_catalog(c, company_id)
+        before = _effective_items(c, company_id, [key])
+        row = c.execute(text("""
             INSERT INTO items (company_id, key, name, module, category, unit, price, active)
             VALUES (:cid, :k, :n, :m, :cat, :u, :p, true)
             ON CONFLICT (company_id, key) DO UPDATE SET
@@ -210,17 +607,317 @@ def upsert_item(engine: Engine, company_id: int, key: str, name: str, module: st
                 unit=excluded.unit,
                 price=excluded.price,
                 active=true
-        """), {"cid": company_id, "k": key, "n": name, "m": module, "cat": category, "u": unit, "p": float(price)})
-
-def seed_company_items(engine: Engine, company_id: int) -> None:
-    # seeds iniciais da sua área (segurança)
-    seeds = [
-        ("cftv_camera_bullet_2mp", "Câmera Bullet 2MP", "seguranca", "cftv_camera", "un", 115.17),
-        ("cftv_camera_dome_4mp", "Câmera Dome 4MP", "seguranca", "cftv_camera", "un", 165.00),
-        ("cftv_dvr", "DVR", "seguranca", "cftv", "un", 0.0),
-        ("cftv_hd", "HD para DVR", "seguranca", "cftv", "un", 0.0),
-        ("mao_cftv_dvr", "Mão de obra (instalação DVR)", "seguranca", "mao_obra", "taxa", 200.0),
-        ("mao_cftv_por_camera_inst", "Mão de obra (instalação por câmera)", "seguranca", "mao_obra", "un", 120.0),
+            RETURNING category, price
+        """), {"cid": company_id, "k": key, "n": name, "m": module, "cat": category, "u": unit, "p": from_cents(price_cents)}).fetchone()
+        _bump_catalog_version(c, company_id)
+        _apply_item_rollups(c, company_id, _changed(before, {key: (row[0], row[1])}))
+    invalidate_catalog(company_id)
+
+# colunas aceitas por bulk_upsert_items / export_items
+ITEM_FIELDS = ("key", "name", "module", "category", "unit", "price_cents")
+
+def bulk_upsert_items(engine: Engine, company_id: int, rows: Iterable[Dict[str, Any]], chunk_size: int = 500) -> Dict[str, int]:
+    # upsert em lotes: um INSERT ... SELECT unnest(...) por lote, tudo numa transação
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+    removed: List[Tuple[str, Decimal]] = []
+    added: List[Tuple[str, Decimal]] = []
+
+    def flush(c, chunk: Dict[str, Dict[str, Any]]) -> None:
+        cols = {f: [r[f] for r in chunk.values()] for f in ITEM_FIELDS}
+        before = _effective_items(c, company_id, list(chunk))
+        res = c.execute(text("""
+            INSERT INTO items (company_id, key, name, module, category, unit, price, active)
+            SELECT :cid, k, n, m, cat, u, CAST(p AS numeric) / 100, true
+            FROM unnest(
+                CAST(:keys AS text[]), CAST(:names AS text[]), CAST(:modules AS text[]),
+                CAST(:categories AS text[]), CAST(:units AS text[]), CAST(:prices AS bigint[])
+            ) AS t(k, n, m, cat, u, p)
+            -- copy-on-write: linha igual à do catálogo base, e ainda não sobrescrita, continua herdada
+            WHERE NOT EXISTS (
+                SELECT 1 FROM base_items b
+                WHERE b.key = t.k AND b.active
+                  AND (b.name, b.module, b.category, b.unit, b.price) = (t.n, t.m, t.cat, t.u, CAST(t.p AS numeric) / 100)
+            ) OR EXISTS (SELECT 1 FROM items i WHERE i.company_id = :cid AND i.key = t.k)
+            ON CONFLICT (company_id, key) DO UPDATE SET
+                name=excluded.name,
+                module=excluded.module,
+                category=excluded.category,
+                unit=excluded.unit,
+                price=excluded.price,
+                active=true
+            WHERE (items.name, items.module, items.category, items.unit, items.price, items.active)
+                IS DISTINCT FROM (excluded.name, excluded.module, excluded.category, excluded.unit, excluded.price, true)
+            RETURNING (xmax = 0) AS inserted, key, category, price
+        """), {
+            "cid": company_id, "keys": cols["key"], "names": cols["name"], "modules": cols["module"],
+            "categories": cols["category"], "units": cols["unit"], "prices": [int(p) for p in cols["price_cents"]],
+        }).fetchall()
+        out, into = _changed(before, {r[1]: (r[2], r[3]) for r in res})
+        removed.extend(out)
+        added.extend(into)
+        inserted = sum(1 for r in res if r[0])
+        counts["inserted"] += inserted
+        counts["updated"] += len(res) - inserted
+        counts["unchanged"] += len(chunk) - len(res)
+
+    with write_conn(engine) as c:
+        _lock_catalog(c, company_id)
+        # dedup por key dentro do lote (ON CONFLICT não aceita a mesma linha duas vezes)
+        chunk: Dict[str, Dict[str, Any]] = {}
+        for r in rows:
+            chunk[r["key"]] = r
+            if len(chunk) >= chunk_size:
+                flush(c, chunk)
+                chunk = {}
+        if chunk:
+            flush(c, chunk)
+        if counts["inserted"] or counts["updated"]:
+            _bump_catalog_version(c, company_id)
+            _apply_item_rollups(c, company_id, (removed, added))
+
+    invalidate_catalog(company_id)
+    return counts
+
+def export_items(engine: Engine, company_id: int, module: Optional[str] = None, batch_size: int = 500) -> Iterator[Dict[str, Any]]:
+    # cursor no servidor: o catálogo sai em lotes, sem carregar tudo em memória
+    where = "active=true"
+    params: Dict[str, Any] = {"cid": company_id}
+    if module:
+        where += " AND module=:m"
+        params["m"] = module
+
+    with _checkout(engine) as c:
+        result = c.execution_options(stream_results=True, yield_per=batch_size).execute(text(f"""
+            SELECT key, name, module, category, unit, price
+            FROM tenant_items(:cid)
+            WHERE {where}
+            ORDER BY module, category, name
+        """), params)
+        for r in result:
+            yield {"key": r[0], "name": r[1], "module": r[2], "category": r[3], "unit": r[4], "price_cents": to_cents(r[5])}
+
+# ---------- ROLLUPS ----------
+# agregados do Dashboard: leitura de poucas linhas, independente do tamanho do catálogo/histórico.
+# item_rollups é mantido em delta na escrita de items (contagem/soma; min/max só recalculam a categoria
+# quando o preço que saiu era o extremo); quote_rollups é mantido em delta pelo trigger quotes_rollup
+# (dia no horário de Brasília)
+
+def _lock_catalog(c, company_id: int) -> None:
+    # o mesmo lock de linha do UPDATE de catalog_version: escritas no catálogo da empresa e nos
+    # agregados ficam em fila, e o "antes" lido depois do lock é o que a escrita vai substituir
+    c.execute(text("SELECT 1 FROM companies WHERE id=:cid FOR NO KEY UPDATE"), {"cid": company_id})
+
+def _effective_items(c, company_id: int, keys: List[str]) -> Dict[str, Tuple[str, Decimal]]:
+    # (categoria, preço) das keys no catálogo efetivo, inclusive as herdadas do base
+    rows = c.execute(text("""
+        SELECT key, category, price
+        FROM tenant_items(:cid)
+        WHERE active AND key = ANY(:keys)
+    """), {"cid": company_id, "keys": keys}).fetchall()
+    return {r[0]: (r[1], r[2]) for r in rows}
+
+def _changed(before: Dict[str, Tuple[str, Decimal]], after: Dict[str, Tuple[str, Decimal]]) -> Tuple[List[Tuple[str, Decimal]], List[Tuple[str, Decimal]]]:
+    # (saíram, entraram) nos agregados; renomear ou trocar a unidade não muda nada
+    removed, added = [], []
+    for key, new in after.items():
+        old = before.get(key)
+        if old != new:
+            if old is not None:
+                removed.append(old)
+            added.append(new)
+    return removed, added
+
+def _refresh_item_rollup(c, company_id: int, category: str) -> None:
+    # recálculo exato de uma categoria (quando o preço que saiu era o min/max dela)
+    c.execute(text("DELETE FROM item_rollups WHERE company_id=:cid AND category=:cat"), {"cid": company_id, "cat": category})
+    c.execute(text("""
+        INSERT INTO item_rollups (company_id, category, item_count, price_sum, price_min, price_max)
+        SELECT :cid, category, count(*), sum(price), min(price), max(price)
+        FROM tenant_items(:cid)
+        WHERE active AND category=:cat
+        GROUP BY category
+    """), {"cid": company_id, "cat": category})
+
+def _apply_item_rollups(c, company_id: int, delta: Tuple[List[Tuple[str, Decimal]], List[Tuple[str, Decimal]]]) -> None:
+    # chamar com _lock_catalog tomado, na transação da escrita
+    removed, added = delta
+    if not removed and not added:
+        return
+    current = {r[0]: (r[1], r[2]) for r in c.execute(text(
+        "SELECT category, price_min, price_max FROM item_rollups WHERE company_id=:cid"), {"cid": company_id})}
+    # categoria -> [Δcontagem, Δsoma, min, max, recalcular]
+    acc: Dict[str, List[Any]] = {}
+    for cat, price in removed:
+        a = acc.setdefault(cat, [0, Decimal(0), None, None, False])
+        a[0] -= 1
+        a[1] -= price
+        cur = current.get(cat)
+        if cur is None or price <= cur[0] or price >= cur[1]:
+            a[4] = True
+    for cat, price in added:
+        a = acc.setdefault(cat, [0, Decimal(0), None, None, False])
+        a[0] += 1
+        a[1] += price
+        a[2] = price if a[2] is None else min(a[2], price)
+        a[3] = price if a[3] is None else max(a[3], price)
+
+    for cat, (n, total, lo, hi, recompute) in acc.items():
+        if recompute:
+            _refresh_item_rollup(c, company_id, cat)
+            continue
+        cur = current.get(cat)
+        c.execute(text("""
+            INSERT INTO item_rollups (company_id, category, item_count, price_sum, price_min, price_max)
+            VALUES (:cid, :cat, :n, :total, :lo, :hi)
+            ON CONFLICT (company_id, category) DO UPDATE SET
+                item_count = item_rollups.item_count + excluded.item_count,
+                price_sum = item_rollups.price_sum + excluded.price_sum,
+                price_min = LEAST(item_rollups.price_min, excluded.price_min),
+                price_max = GREATEST(item_rollups.price_max, excluded.price_max)
+        """), {"cid": company_id, "cat": cat, "n": n, "total": total,
+               # só saída (sem extremo): min/max ficam como estão
+               "lo": cur[0] if lo is None else lo, "hi": cur[1] if hi is None else hi})
+
+def item_rollups(engine: Engine, company_id: int) -> List[Dict[str, Any]]:
+    # só leitura: as empresas existentes foram calculadas na migração 10 e as novas no provision_tenant;
+    # sem linhas = catálogo sem itens ativos
+    with read_conn(engine) as c:
+        rows = c.execute(text("""
+            SELECT category, item_count, price_sum, price_min, price_max
+            FROM item_rollups
+            WHERE company_id=:cid
+            ORDER BY category
+        """), {"cid": company_id}).fetchall()
+    out = []
+    for r in rows:
+        count, total = int(r[1]), to_cents(r[2])
+        out.append({"category": r[0], "item_count": count, "avg_cents": (total + count // 2) // count if count else 0,
+                    "min_cents": to_cents(r[3]), "max_cents": to_cents(r[4])})
+    return out
+
+def quote_rollups(engine: Engine, company_id: int, days: int = 30) -> List[Dict[str, Any]]:
+    # últimos N dias por dia e serviço: no máximo N × serviços linhas, pela PK
+    with read_conn(engine) as c:
+        rows = c.execute(text("""
+            SELECT r.day, r.service_id, r.quote_count, r.revenue
+            FROM quote_rollups r
+            WHERE r.company_id=:cid
+              AND r.day > (now() AT TIME ZONE 'America/Sao_Paulo')::date - :days
+              AND r.quote_count > 0
+            ORDER BY r.day, r.service_id
+        """), {"cid": company_id, "days": days}).fetchall()
+    return [{"day": r[0], "service_id": r[1], "quote_count": int(r[2]), "revenue_cents": to_cents(r[3])} for r in rows]
+
+# ---------- QUOTES ----------
+# subtotal/line_count de quotes são mantidos pelo trigger quote_lines_totals
+
+def _insert_quote_lines(c, quote_id: int, lines: List[Dict[str, Any]]) -> None:
+    if not lines:
+        return
+    c.execute(text("""
+        INSERT INTO quote_lines (quote_id, item_key, description, qty, unit_price)
+        SELECT :qid, k, d, q, CAST(p AS numeric) / 100
+        FROM unnest(
+            CAST(:keys AS text[]), CAST(:descs AS text[]), CAST(:qtys AS numeric[]), CAST(:prices AS bigint[])
+        ) AS t(k, d, q, p)
+    """), {
+        "qid": quote_id,
+        "keys": [ln.get("key", "") for ln in lines],
+        "descs": [ln["desc"] for ln in lines],
+        "qtys": [str(ln["qty"]) for ln in lines],
+        "prices": [int(ln["unit_cents"]) for ln in lines],
+    })
+
+def save_quote(engine: Engine, company_id: int, user_id: Optional[int], quote: Dict[str, Any], customer: str = "") -> int:
+    with write_conn(engine) as c:
+        quote_id = int(c.execute(text("""
+            INSERT INTO quotes (company_id, created_by, service_id, service_name, customer)
+            VALUES (:cid, :uid, :sid, :sname, :cust)
+            RETURNING id;
+        """), {
+            "cid": company_id, "uid": user_id, "sid": quote.get("service_id", ""),
+            "sname": quote.get("service_name", ""), "cust": customer.strip(),
+        }).scalar())
+        _insert_quote_lines(c, quote_id, quote.get("items", []))
+    return quote_id
+
+def _qty(d: Decimal) -> Any:
+    # NUMERIC(12,3): inteiro quando não há fração (o caso comum), senão float para exibição
+    return int(d) if d == d.to_integral_value() else float(d)
+
+def _quote_header(r) -> Dict[str, Any]:
+    return {
+        "id": int(r[0]), "service_id": r[1], "service_name": r[2], "customer": r[3],
+        "subtotal_cents": to_cents(r[4]), "line_count": int(r[5]), "created_at": r[6],
+    }
+
+def list_quotes(engine: Engine, company_id: int, before: Optional[Tuple[datetime, int]] = None, limit: int = 50) -> Tuple[List[Dict[str, Any]], Optional[Tuple[datetime, int]]]:
+    # mais recentes primeiro; `before` é o cursor (created_at, id) da página anterior
+    where = "company_id=:cid"
+    params: Dict[str, Any] = {"cid": company_id, "lim": limit + 1}
+    if before is not None:
+        where += " AND (created_at, id) < (:bt, :bid)"
+        params.update({"bt": before[0], "bid": before[1]})
+
+    with read_conn(engine) as c:
+        rows = c.execute(text(f"""
+            SELECT id, service_id, service_name, customer, subtotal, line_count, created_at
+            FROM quotes
+            WHERE {where}
+            ORDER BY created_at DESC, id DESC
+            LIMIT :lim
+        """), params).fetchall()
+
+    out = [_quote_header(r) for r in rows[:limit]]
+    cursor = (out[-1]["created_at"], out[-1]["id"]) if len(rows) > limit else None
+    return out, cursor
+
+def get_quote(engine: Engine, company_id: int, quote_id: int) -> Optional[Dict[str, Any]]:
+    with read_conn(engine) as c:
+        head = c.execute(text("""
+            SELECT id, service_id, service_name, customer, subtotal, line_count, created_at
+            FROM quotes
+            WHERE id=:qid AND company_id=:cid
+        """), {"qid": quote_id, "cid": company_id}).fetchone()
+        if not head:
+            return None
+        lines = c.execute(text("""
+            SELECT id, item_key, description, qty, unit_price, sub
+            FROM quote_lines
+            WHERE quote_id=:qid
+            ORDER BY id
+        """), {"qid": quote_id}).fetchall()
+
+    quote = _quote_header(head)
+    quote["items"] = [
+        {"line_id": int(r[0]), "key": r[1], "desc": r[2], "qty": _qty(r[3]), "unit_cents": to_cents(r[4]), "sub_cents": to_cents(r[5])}
+        for r in lines
     ]
-    for k, n, m, cat, u, p in seeds:
-        upsert_item(engine, company_id, k, n, m, cat, u, p)
+    return quote
+
+def add_quote_line(engine: Engine, company_id: int, quote_id: int, line: Dict[str, Any]) -> bool:
+    with write_conn(engine) as c:
+        owned = c.execute(text("SELECT 1 FROM quotes WHERE id=:qid AND company_id=:cid FOR UPDATE"),
+                          {"qid": quote_id, "cid": company_id}).fetchone()
+        if not owned:
+            return False
+        _insert_quote_lines(c, quote_id, [line])
+    return True
+
+def update_quote_line(engine: Engine, company_id: int, line_id: int, qty: Any, unit_cents: Cents) -> bool:
+    with write_conn(engine) as c:
+        res = c.execute(text("""
+            UPDATE quote_lines l SET qty=:q, unit_price=CAST(:p AS numeric) / 100
+            FROM quotes q
+            WHERE l.id=:lid AND q.id=l.quote_id AND q.company_id=:cid
+        """), {"lid": line_id, "cid": company_id, "q": str(qty), "p": int(unit_cents)})
+    return res.rowcount > 0
+
+def delete_quote_line(engine: Engine, company_id: int, line_id: int) -> bool:
+    with write_conn(engine) as c:
+        res = c.execute(text("""
+            DELETE FROM quote_lines l
+            USING quotes q
+            WHERE l.id=:lid AND q.id=l.quote_id AND q.company_id=:cid
+        """), {"lid": line_id, "cid": company_id})
+    return res.rowcount > 0
@@ -0,0 +1,305 @@
+import json
+import logging
+import math
+import re
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from core.cache import env_float, env_int
+
+# instrumentação por consulta: tempo, linhas e helper de core/* que disparou cada SQL.
+#   DB_INSTRUMENT=0       desliga (padrão ligado; custo ~ alguns µs por consulta)
+#   DB_SLOW_QUERY_MS=200  limite do log de consultas lentas (logger "core.db.slow")
+#   DB_INSTRUMENT_WINDOW  amostras por consulta no histograma móvel
+ENABLED = env_int("DB_INSTRUMENT", 1) != 0
+SLOW_QUERY_MS = env_float("DB_SLOW_QUERY_MS", 200.0)
+WINDOW = env_int("DB_INSTRUMENT_WINDOW", 512)
+MAX_QUERIES = env_int("DB_INSTRUMENT_MAX_QUERIES", 500)
+# perfil por seção do rerun (auth, guard, sidebar, página, CSS, widgets); opt-in
+PROFILE = env_int("PORTAL_PROFILE", 0) != 0
+
+# limites superiores dos buckets, em ms
+BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, math.inf)
+
+slow_log = logging.getLogger("core.db.slow")
+profile_log = logging.getLogger("core.profile")
+
+# frames que não identificam quem consultou (conexão, contextlib, SQLAlchemy)
+_SKIP_MODULES = ("sqlalchemy", "contextlib", "core.instrument")
+_SKIP_FUNCS = {"_checkout", "read_conn", "write_conn", "unit_of_work", "__enter__", "__exit__"}
+
+def _pct(s: List[float], p: float) -> float:
+    return s[min(len(s) - 1, max(0, math.ceil(p / 100 * len(s)) - 1))] if s else 0.0
+
+class QueryStats:
+    __slots__ = ("caller", "statement", "count", "total_ms", "rows", "max_ms", "window")
+
+    def __init__(self, caller: str, statement: str):
+        self.caller = caller
+        self.statement = statement
+        self.count = 0
+        self.total_ms = 0.0
+        self.rows = 0
+        self.max_ms = 0.0
+        self.window: Deque[float] = deque(maxlen=WINDOW)
+
+    def add(self, ms: float, rows: int) -> None:
+        self.count += 1
+        self.total_ms += ms
+        self.rows += max(rows, 0)
+        self.max_ms = max(self.max_ms, ms)
+        self.window.append(ms)
+
+    def to_dict(self) -> Dict[str, Any]:
+        s = sorted(self.window)
+        pct = lambda p: _pct(s, p)
+        hist = [0] * len(BUCKETS)
+        for ms in s:
+            hist[next(i for i, b in enumerate(BUCKETS) if ms <= b)] += 1
+        return {
+            "caller": self.caller,
+            "statement": self.statement,
+            "count": self.count,
+            "total_ms": round(self.total_ms, 3),
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "p50_ms": round(pct(50), 3),
+            "p95_ms": round(pct(95), 3),
+            "p99_ms": round(pct(99), 3),
+            "max_ms": round(self.max_ms, 3),
+            "rows": self.rows,
+            "histogram": {("inf" if b == math.inf else str(b)): c for b, c in zip(BUCKETS, hist)},
+        }
+
+class SpanStats:
+    __slots__ = ("name", "count", "total_ms", "max_ms", "window")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.window: Deque[float] = deque(maxlen=WINDOW)
+
+    def add(self, ms: float) -> None:
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self.window.append(ms)
+
+    def to_dict(self) -> Dict[str, Any]:
+        s = sorted(self.window)
+        return {
+            "name": self.name,
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "p50_ms": round(_pct(s, 50), 3),
+            "p95_ms": round(_pct(s, 95), 3),
+            "max_ms": round(self.max_ms, 3),
+        }
+
+class RerunStats:
+    __slots__ = ("label", "started", "queries", "db_ms", "rows", "elapsed_ms", "by_caller", "spans", "page_t0")
+
+    def __init__(self, label: str):
+        self.label = label
+        self.started = time.time()
+        self.queries = 0
+        self.db_ms = 0.0
+        self.rows = 0
+        self.elapsed_ms = 0.0
+        self.by_caller: Dict[str, List[float]] = {}
+        self.spans: Dict[str, float] = {}
+        self.page_t0: Optional[float] = None
+
+    def add(self, caller: str, ms: float, rows: int) -> None:
+        self.queries += 1
+        self.db_ms += ms
+        self.rows += max(rows, 0)
+        agg = self.by_caller.setdefault(caller, [0, 0.0])
+        agg[0] += 1
+        agg[1] += ms
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "label": self.label,
+            "started": self.started,
+            "elapsed_ms": round(self.elapsed_ms, 3),
+            "queries": self.queries,
+            "db_ms": round(self.db_ms, 3),
+            "rows": self.rows,
+            "by_caller": {k: {"count": int(v[0]), "ms": round(v[1], 3)}
+                          for k, v in sorted(self.by_caller.items(), key=lambda kv: -kv[1][1])},
+            "spans": {k: round(v, 3) for k, v in sorted(self.spans.items(), key=lambda kv: -kv[1])},
+        }
+
+_lock = threading.Lock()
+_queries: Dict[Tuple[str, str], QueryStats] = {}
+_slow: Deque[Dict[str, Any]] = deque(maxlen=env_int("DB_SLOW_QUERY_KEEP", 100))
+_reruns: Deque[Dict[str, Any]] = deque(maxlen=env_int("DB_INSTRUMENT_RERUNS", 50))
+_spans: Dict[str, SpanStats] = {}
+_current: ContextVar[Optional[RerunStats]] = ContextVar("db_rerun_stats", default=None)
+_ws = re.compile(r"\s+")
+
+def _fingerprint(statement: str) -> str:
+    return _ws.sub(" ", statement).strip()[:160]
+
+def _caller() -> str:
+    f = sys._getframe(2)
+    while f is not None:
+        mod = f.f_globals.get("__name__", "")
+        if not mod.startswith(_SKIP_MODULES) and f.f_code.co_name not in _SKIP_FUNCS:
+            return f"{mod}.{f.f_code.co_name}"
+        f = f.f_back
+    return "?"
+
+def _before(conn, cursor, statement, parameters, context, executemany) -> None:
+    context._instr_t0 = time.perf_counter()
+
+def _after(conn, cursor, statement, parameters, context, executemany) -> None:
+    t0 = getattr(context, "_instr_t0", None)
+    if t0 is None:
+        return
+    ms = (time.perf_counter() - t0) * 1000
+    rows = getattr(cursor, "rowcount", -1)
+    rows = rows if isinstance(rows, int) else -1
+    caller = _caller()
+    fp = _fingerprint(statement)
+
+    with _lock:
+        key = (caller, fp)
+        qs = _queries.get(key)
+        if qs is None:
+            if len(_queries) >= MAX_QUERIES:
+                key = (caller, "<outras>")
+                qs = _queries.get(key)
+            if qs is None:
+                qs = _queries[key] = QueryStats(*key)
+        qs.add(ms, rows)
+        if ms >= SLOW_QUERY_MS:
+            _slow.append({"at": time.time(), "caller": caller, "ms": round(ms, 3), "rows": rows, "statement": fp})
+
+    rerun = _current.get()
+    if rerun is not None:
+        rerun.add(caller, ms, rows)
+    if ms >= SLOW_QUERY_MS:
+        slow_log.warning("consulta lenta %.1f ms em %s (%d linhas): %s", ms, caller, rows, fp)
+
+def install(engine: Engine) -> None:
+    if not ENABLED or event.contains(engine, "after_cursor_execute", _after):
+        return
+    event.listen(engine, "before_cursor_execute", _before)
+    event.listen(engine, "after_cursor_execute", _after)
+
+# ---------- RERUN ----------
+@contextmanager
+def track(label: str = "rerun") -> Iterator[RerunStats]:
+    # agrega as consultas de um rerun do Streamlit (ou de uma requisição da API)
+    stats = RerunStats(label)
+    token = _current.set(stats)
+    t0 = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        end = time.perf_counter()
+        stats.elapsed_ms = (end - t0) * 1000
+        if stats.page_t0 is not None:
+            # a página vai do tag() até o fim do rerun (inclusive st.stop/st.rerun)
+            _add_span(stats, f"page:{stats.label}", (end - stats.page_t0) * 1000)
+        _current.reset(token)
+        summary = stats.to_dict()
+        with _lock:
+            _reruns.append(summary)
+        if PROFILE:
+            profile_log.info("rerun %s: %.1f ms, %d consultas (%.1f ms de banco), seções %s",
+                             stats.label, stats.elapsed_ms, stats.queries, stats.db_ms, summary["spans"])
+
+def tag(label: str) -> None:
+    # renomeia o rerun corrente com a página escolhida no menu; no modo perfil, a página começa aqui
+    rerun = _current.get()
+    if rerun is not None:
+        rerun.label = label
+        if PROFILE:
+            rerun.page_t0 = time.perf_counter()
+
+# ---------- PERFIL ----------
+def _add_span(rerun: RerunStats, name: str, ms: float) -> None:
+    rerun.spans[name] = rerun.spans.get(name, 0.0) + ms
+    with _lock:
+        sp = _spans.get(name)
+        if sp is None:
+            sp = _spans[name] = SpanStats(name)
+        sp.add(ms)
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    # tempo inclusivo de um trecho do rerun; sem PORTAL_PROFILE não mede nada
+    rerun = _current.get() if PROFILE else None
+    if rerun is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        _add_span(rerun, name, (time.perf_counter() - t0) * 1000)
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+def profiled(name: str) -> Callable[[F], F]:
+    # decorator para helpers de UI; com o perfil desligado devolve a função intacta
+    def deco(fn: F) -> F:
+        if not PROFILE:
+            return fn
+
+        @wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper  # type: ignore[return-value]
+    return deco
+
+def current() -> Optional[Dict[str, Any]]:
+    rerun = _current.get()
+    return rerun.to_dict() if rerun is not None else None
+
+# ---------- LEITURA ----------
+def snapshot() -> Dict[str, Any]:
+    with _lock:
+        queries = [qs.to_dict() for qs in _queries.values()]
+        slow = list(_slow)
+        reruns = list(_reruns)
+        spans = [sp.to_dict() for sp in _spans.values()]
+    queries.sort(key=lambda q: -q["total_ms"])
+    spans.sort(key=lambda sp: -sp["p95_ms"])
+    return {
+        "enabled": ENABLED,
+        "profile": PROFILE,
+        "spans": spans,
+        "slow_query_ms": SLOW_QUERY_MS,
+        "queries": queries,
+        "slow": slow[::-1],
+        "reruns": reruns[::-1],
+    }
+
+def dump_json(path: Optional[str] = None) -> str:
+    out = json.dumps(snapshot(), ensure_ascii=False, indent=2, default=str)
+    if path:
+        with open(path, "w", encoding="utf-8") as fp:
+            fp.write(out)
+    return out
+
+def reset() -> None:
+    with _lock:
+        _queries.clear()
+        _slow.clear()
+        _reruns.clear()
+        _spans.clear()
@@ -0,0 +1,476 @@
+from typing import List, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+# chave do advisory lock: só um processo aplica migrações por vez
+MIGRATION_LOCK_KEY = 7262001
+
+# (versão, descrição, comandos) — nunca edite uma migração já publicada, crie a próxima
+MIGRATIONS: List[Tuple[int, str, List[str]]] = [
+    (1, "schema inicial", [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id BIGSERIAL PRIMARY KEY,
+            email TEXT UNIQUE NOT NULL,
+            name TEXT NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS companies (
+            id BIGSERIAL PRIMARY KEY,
+            name TEXT NOT NULL,
+            whatsapp TEXT DEFAULT '',
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS memberships (
+            user_id BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+            company_id BIGINT NOT NULL REFERENCES companies(id) ON DELETE CASCADE,
+            role TEXT NOT NULL DEFAULT 'admin',
+            PRIMARY KEY (user_id, company_id)
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS plans (
+            id BIGSERIAL PRIMARY KEY,
+            code TEXT UNIQUE NOT NULL,
+            name TEXT NOT NULL,
+            price_monthly_cents INT NOT NULL DEFAULT 0,
+            max_users INT NOT NULL DEFAULT 1,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS subscriptions (
+            company_id BIGINT PRIMARY KEY REFERENCES companies(id) ON DELETE CASCADE,
+            plan_id BIGINT NOT NULL REFERENCES plans(id),
+            status TEXT NOT NULL DEFAULT 'trial', -- trial|active|past_due|canceled
+            current_period_end TIMESTAMPTZ NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS items (
+            id BIGSERIAL PRIMARY KEY,
+            company_id BIGINT NOT NULL REFERENCES companies(id) ON DELETE CASCADE,
+            key TEXT NOT NULL,
+            name TEXT NOT NULL,
+            module TEXT NOT NULL DEFAULT 'seguranca',
+            category TEXT NOT NULL DEFAULT '',
+            unit TEXT NOT NULL DEFAULT 'un',
+            price NUMERIC(12,2) NOT NULL DEFAULT 0,
+            active BOOLEAN NOT NULL DEFAULT TRUE,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            UNIQUE(company_id, key)
+        );
+        """,
+        # cria planos básicos se não existirem
+        """
+        INSERT INTO plans (code, name, price_monthly_cents, max_users)
+        VALUES
+          ('basic', 'Básico', 2900, 1),
+          ('pro', 'Pro', 5900, 3),
+          ('agency', 'Agência', 9900, 10)
+        ON CONFLICT (code) DO NOTHING;
+        """,
+    ]),
+    (2, "índices de catálogo e busca sem acento", [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm;",
+        "CREATE EXTENSION IF NOT EXISTS unaccent;",
+        # unaccent() não é IMMUTABLE; o wrapper permite usá-lo em índice
+        """
+        CREATE OR REPLACE FUNCTION f_unaccent(text) RETURNS text
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+        AS $$ SELECT public.unaccent('public.unaccent', $1) $$;
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS items_tenant_filter_idx
+        ON items (company_id, module, category, active);
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS items_search_trgm_idx
+        ON items USING gin (f_unaccent(lower(name || ' ' || key)) gin_trgm_ops);
+        """,
+    ]),
+    (3, "índice de paginação keyset do catálogo", [
+        """
+        CREATE INDEX IF NOT EXISTS items_keyset_idx
+        ON items (company_id, module, category, name, key)
+        WHERE active;
+        """,
+    ]),
+    (4, "orçamentos persistidos", [
+        """
+        CREATE TABLE IF NOT EXISTS quotes (
+            id BIGSERIAL PRIMARY KEY,
+            company_id BIGINT NOT NULL REFERENCES companies(id) ON DELETE CASCADE,
+            created_by BIGINT REFERENCES users(id) ON DELETE SET NULL,
+            service_id TEXT NOT NULL DEFAULT '',
+            service_name TEXT NOT NULL DEFAULT '',
+            customer TEXT NOT NULL DEFAULT '',
+            subtotal NUMERIC(14,2) NOT NULL DEFAULT 0, -- mantido pelo trigger de quote_lines
+            line_count INT NOT NULL DEFAULT 0,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS quote_lines (
+            id BIGSERIAL PRIMARY KEY,
+            quote_id BIGINT NOT NULL REFERENCES quotes(id) ON DELETE CASCADE,
+            item_key TEXT NOT NULL DEFAULT '',
+            description TEXT NOT NULL,
+            qty NUMERIC(12,3) NOT NULL,
+            unit_price NUMERIC(12,2) NOT NULL,
+            sub NUMERIC(14,2) GENERATED ALWAYS AS (ROUND(qty * unit_price, 2)) STORED
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS quote_lines_quote_idx ON quote_lines (quote_id);",
+        # histórico: keyset em (created_at, id) dentro da empresa
+        "CREATE INDEX IF NOT EXISTS quotes_company_created_idx ON quotes (company_id, created_at DESC, id DESC);",
+        # total incremental: cada linha inserida/alterada/removida aplica só o delta no cabeçalho
+        """
+        CREATE OR REPLACE FUNCTION quote_lines_apply_totals() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                UPDATE quotes SET subtotal = subtotal - OLD.sub, line_count = line_count - 1 WHERE id = OLD.quote_id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                UPDATE quotes SET subtotal = subtotal + NEW.sub, line_count = line_count + 1 WHERE id = NEW.quote_id;
+            END IF;
+            RETURN NULL;
+        END $$;
+        """,
+        "DROP TRIGGER IF EXISTS quote_lines_totals ON quote_lines;",
+        """
+        CREATE TRIGGER quote_lines_totals
+        AFTER INSERT OR UPDATE OR DELETE ON quote_lines
+        FOR EACH ROW EXECUTE FUNCTION quote_lines_apply_totals();
+        """,
+    ]),
+    (5, "histórico de preços com vigência", [
+        """
+        CREATE TABLE IF NOT EXISTS item_prices (
+            id BIGSERIAL PRIMARY KEY,
+            company_id BIGINT NOT NULL REFERENCES companies(id) ON DELETE CASCADE,
+            key TEXT NOT NULL,
+            price NUMERIC(12,2) NOT NULL,
+            effective_from TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        """,
+        # preço de K para C no instante T = 1ª linha deste índice com effective_from <= T
+        """
+        CREATE INDEX IF NOT EXISTS item_prices_lookup_idx
+        ON item_prices (company_id, key, effective_from DESC, id DESC);
+        """,
+        # items.price continua sendo o preço atual (materializado); price_id aponta a linha do histórico
+        "ALTER TABLE items ADD COLUMN IF NOT EXISTS price_id BIGINT REFERENCES item_prices(id);",
+        """
+        INSERT INTO item_prices (company_id, key, price, effective_from)
+        SELECT company_id, key, price, created_at FROM items WHERE price_id IS NULL;
+        """,
+        """
+        UPDATE items i SET price_id = p.id
+        FROM item_prices p
+        WHERE i.price_id IS NULL AND p.company_id = i.company_id AND p.key = i.key;
+        """,
+        # todo INSERT/UPDATE que muda o preço (upsert unitário ou em lote) anexa ao histórico.
+        # AFTER, não BEFORE: BEFORE INSERT dispara até para linhas que caem no ON CONFLICT.
+        """
+        CREATE OR REPLACE FUNCTION items_record_price() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        DECLARE
+            pid BIGINT;
+        BEGIN
+            INSERT INTO item_prices (company_id, key, price)
+            VALUES (NEW.company_id, NEW.key, NEW.price)
+            RETURNING id INTO pid;
+            -- só price_id muda: não redispara os triggers "UPDATE OF price, key"
+            UPDATE items SET price_id = pid WHERE id = NEW.id;
+            RETURN NULL;
+        END $$;
+        """,
+        "DROP TRIGGER IF EXISTS items_price_history_ins ON items;",
+        "DROP TRIGGER IF EXISTS items_price_history_upd ON items;",
+        """
+        CREATE TRIGGER items_price_history_ins
+        AFTER INSERT ON items
+        FOR EACH ROW EXECUTE FUNCTION items_record_price();
+        """,
+        """
+        CREATE TRIGGER items_price_history_upd
+        AFTER UPDATE OF price, key ON items
+        FOR EACH ROW
+        WHEN (OLD.price IS DISTINCT FROM NEW.price OR OLD.key IS DISTINCT FROM NEW.key)
+        EXECUTE FUNCTION items_record_price();
+        """,
+    ]),
+    (6, "índice de membros por empresa", [
+        # a PK (user_id, company_id) não serve para contar membros de uma empresa (limite max_users)
+        "CREATE INDEX IF NOT EXISTS memberships_company_idx ON memberships (company_id);",
+    ]),
+    (7, "catálogo base compartilhado (copy-on-write)", [
+        # itens padrão de todas as empresas; items guarda só o que a empresa criou ou alterou
+        """
+        CREATE TABLE IF NOT EXISTS base_items (
+            key TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            module TEXT NOT NULL DEFAULT 'seguranca',
+            category TEXT NOT NULL DEFAULT '',
+            unit TEXT NOT NULL DEFAULT 'un',
+            price NUMERIC(12,2) NOT NULL DEFAULT 0,
+            active BOOLEAN NOT NULL DEFAULT TRUE,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        """,
+        """
+        INSERT INTO base_items (key, name, module, category, unit, price)
+        VALUES
+          ('cftv_camera_bullet_2mp', 'Câmera Bullet 2MP', 'seguranca', 'cftv_camera', 'un', 115.17),
+          ('cftv_camera_dome_4mp', 'Câmera Dome 4MP', 'seguranca', 'cftv_camera', 'un', 165.00),
+          ('cftv_dvr', 'DVR', 'seguranca', 'cftv', 'un', 0),
+          ('cftv_hd', 'HD para DVR', 'seguranca', 'cftv', 'un', 0),
+          ('mao_cftv_dvr', 'Mão de obra (instalação DVR)', 'seguranca', 'mao_obra', 'taxa', 200.00),
+          ('mao_cftv_por_camera_inst', 'Mão de obra (instalação por câmera)', 'seguranca', 'mao_obra', 'un', 120.00)
+        ON CONFLICT (key) DO NOTHING;
+        """,
+        # cópias do seed que a empresa nunca alterou passam a ser herdadas (o histórico de preço fica)
+        """
+        DELETE FROM items i
+        USING base_items b
+        WHERE i.key = b.key
+          AND (i.name, i.module, i.category, i.unit, i.price, i.active)
+            = (b.name, b.module, b.category, b.unit, b.price, b.active);
+        """,
+        # catálogo efetivo da empresa: as linhas dela + as do base que ela não sobrescreveu.
+        # SQL simples e STABLE: o planner expande a função na consulta e usa os índices de items
+        """
+        CREATE OR REPLACE FUNCTION tenant_items(cid BIGINT)
+        RETURNS TABLE (key TEXT, name TEXT, module TEXT, category TEXT, unit TEXT, price NUMERIC, active BOOLEAN)
+        LANGUAGE sql STABLE AS $$
+            SELECT i.key, i.name, i.module, i.category, i.unit, i.price, i.active
+            FROM items i
+            WHERE i.company_id = cid
+            UNION ALL
+            SELECT b.key, b.name, b.module, b.category, b.unit, b.price, b.active
+            FROM base_items b
+            WHERE NOT EXISTS (SELECT 1 FROM items o WHERE o.company_id = cid AND o.key = b.key)
+        $$;
+        """,
+    ]),
+    (8, "ciclo de vida da assinatura (flag, eventos, varredura)", [
+        "ALTER TABLE subscriptions ADD COLUMN IF NOT EXISTS is_active BOOLEAN NOT NULL DEFAULT true;",
+        """
+        UPDATE subscriptions
+        SET is_active = status IN ('trial', 'active') AND current_period_end > now();
+        """,
+        # varredura: status = X AND current_period_end <= agora, em ordem de vencimento
+        "CREATE INDEX IF NOT EXISTS subscriptions_expiry_idx ON subscriptions (status, current_period_end);",
+        """
+        CREATE TABLE IF NOT EXISTS subscription_events (
+            id BIGSERIAL PRIMARY KEY,
+            company_id BIGINT NOT NULL REFERENCES companies(id) ON DELETE CASCADE,
+            from_status TEXT,
+            to_status TEXT NOT NULL,
+            period_end TIMESTAMPTZ NOT NULL,
+            at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        """,
+        "CREATE INDEX IF NOT EXISTS subscription_events_company_idx ON subscription_events (company_id, at DESC);",
+        # is_active acompanha status/vencimento em qualquer escrita (varredura, cobrança, ajuste manual)
+        """
+        CREATE OR REPLACE FUNCTION subscriptions_set_active() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            NEW.is_active := NEW.status IN ('trial', 'active') AND NEW.current_period_end > now();
+            RETURN NEW;
+        END $$;
+        """,
+        "DROP TRIGGER IF EXISTS subscriptions_active ON subscriptions;",
+        """
+        CREATE TRIGGER subscriptions_active
+        BEFORE INSERT OR UPDATE OF status, current_period_end ON subscriptions
+        FOR EACH ROW EXECUTE FUNCTION subscriptions_set_active();
+        """,
+        """
+        CREATE OR REPLACE FUNCTION subscriptions_record_event() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            INSERT INTO subscription_events (company_id, from_status, to_status, period_end)
+            VALUES (NEW.company_id, CASE WHEN TG_OP = 'UPDATE' THEN OLD.status END, NEW.status, NEW.current_period_end);
+            RETURN NULL;
+        END $$;
+        """,
+        "DROP TRIGGER IF EXISTS subscriptions_events_ins ON subscriptions;",
+        """
+        CREATE TRIGGER subscriptions_events_ins
+        AFTER INSERT ON subscriptions
+        FOR EACH ROW EXECUTE FUNCTION subscriptions_record_event();
+        """,
+        "DROP TRIGGER IF EXISTS subscriptions_events_upd ON subscriptions;",
+        """
+        CREATE TRIGGER subscriptions_events_upd
+        AFTER UPDATE OF status ON subscriptions
+        FOR EACH ROW
+        WHEN (OLD.status IS DISTINCT FROM NEW.status)
+        EXECUTE FUNCTION subscriptions_record_event();
+        """,
+    ]),
+    (9, "versão do catálogo por empresa", [
+        # incrementada a cada escrita em items; chave dos orçamentos memorizados (services.engine)
+        "ALTER TABLE companies ADD COLUMN IF NOT EXISTS catalog_version BIGINT NOT NULL DEFAULT 0;",
+    ]),
+    (10, "agregados do dashboard", [
+        # por categoria do catálogo efetivo (itens próprios + herdados); recalculado na escrita de items
+        """
+        CREATE TABLE IF NOT EXISTS item_rollups (
+            company_id BIGINT NOT NULL REFERENCES companies(id) ON DELETE CASCADE,
+            category TEXT NOT NULL,
+            item_count INT NOT NULL,
+            price_sum NUMERIC(16,2) NOT NULL,
+            price_min NUMERIC(12,2) NOT NULL,
+            price_max NUMERIC(12,2) NOT NULL,
+            PRIMARY KEY (company_id, category)
+        );
+        """,
+        """
+        INSERT INTO item_rollups (company_id, category, item_count, price_sum, price_min, price_max)
+        SELECT co.id, t.category, count(*), sum(t.price), min(t.price), max(t.price)
+        FROM companies co
+        CROSS JOIN LATERAL tenant_items(co.id) t
+        WHERE t.active
+        GROUP BY co.id, t.category
+        ON CONFLICT DO NOTHING;
+        """,
+        # por dia (horário de Brasília) e serviço; mantido em delta pelo trigger de quotes
+        """
+        CREATE TABLE IF NOT EXISTS quote_rollups (
+            company_id BIGINT NOT NULL REFERENCES companies(id) ON DELETE CASCADE,
+            day DATE NOT NULL,
+            service_id TEXT NOT NULL,
+            quote_count INT NOT NULL DEFAULT 0,
+            revenue NUMERIC(16,2) NOT NULL DEFAULT 0,
+            PRIMARY KEY (company_id, day, service_id)
+        );
+        """,
+        """
+        INSERT INTO quote_rollups (company_id, day, service_id, quote_count, revenue)
+        SELECT company_id, (created_at AT TIME ZONE 'America/Sao_Paulo')::date, service_id, count(*), sum(subtotal)
+        FROM quotes
+        GROUP BY 1, 2, 3
+        ON CONFLICT DO NOTHING;
+        """,
+        """
+        CREATE OR REPLACE FUNCTION quotes_apply_rollup() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            -- caso comum: uma linha entrou/saiu do orçamento, só o subtotal mudou
+            IF TG_OP = 'UPDATE' AND OLD.service_id = NEW.service_id AND OLD.created_at = NEW.created_at THEN
+                UPDATE quote_rollups
+                SET revenue = revenue + NEW.subtotal - OLD.subtotal
+                WHERE company_id = NEW.company_id
+                  AND day = (NEW.created_at AT TIME ZONE 'America/Sao_Paulo')::date
+                  AND service_id = NEW.service_id;
+                RETURN NULL;
+            END IF;
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                UPDATE quote_rollups
+                SET quote_count = quote_count - 1, revenue = revenue - OLD.subtotal
+                WHERE company_id = OLD.company_id
+                  AND day = (OLD.created_at AT TIME ZONE 'America/Sao_Paulo')::date
+                  AND service_id = OLD.service_id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO quote_rollups (company_id, day, service_id, quote_count, revenue)
+                VALUES (NEW.company_id, (NEW.created_at AT TIME ZONE 'America/Sao_Paulo')::date, NEW.service_id, 1, NEW.subtotal)
+                ON CONFLICT (company_id, day, service_id) DO UPDATE SET
+                    quote_count = quote_rollups.quote_count + 1,
+                    revenue = quote_rollups.revenue + excluded.revenue;
+            END IF;
+            RETURN NULL;
+        END $$;
+        """,
+        # o trigger de quote_lines atualiza quotes.subtotal, e isso dispara este aqui com o delta
+        "DROP TRIGGER IF EXISTS quotes_rollup ON quotes;",
+        """
+        CREATE TRIGGER quotes_rollup
+        AFTER INSERT OR DELETE OR UPDATE OF subtotal, service_id, created_at ON quotes
+        FOR EACH ROW EXECUTE FUNCTION quotes_apply_rollup();
+        """,
+    ]),
+    (11, "histórico de preços sem items.price_id", [
+        # ninguém lia price_id, e o UPDATE extra no trigger dobrava as escritas em items a cada mudança de preço;
+        # o preço vigente continua em items.price e o histórico em item_prices
+        """
+        CREATE OR REPLACE FUNCTION items_record_price() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            INSERT INTO item_prices (company_id, key, price)
+            VALUES (NEW.company_id, NEW.key, NEW.price);
+            RETURN NULL;
+        END $$;
+        """,
+        "ALTER TABLE items DROP COLUMN IF EXISTS price_id;",
+    ]),
+    (12, "convites de equipe", [
+        # o admin convida por email, exista a conta ou não; o vínculo só nasce quando a pessoa aceita
+        """
+        CREATE TABLE IF NOT EXISTS member_invites (
+            company_id BIGINT NOT NULL REFERENCES companies(id) ON DELETE CASCADE,
+            email TEXT NOT NULL,
+            role TEXT NOT NULL DEFAULT 'member',
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (company_id, email)
+        );
+        """,
+        # convites de quem acabou de entrar (login/cadastro)
+        "CREATE INDEX IF NOT EXISTS member_invites_email_idx ON member_invites (email);",
+    ]),
+    (13, "convites por código de uso único", [
+        # o email do cadastro não é verificado: aceitar pelo email deixava quem registrasse o endereço
+        # convidado entrar na empresa. O convite passa a ser um código entregue pelo admin; só o hash
+        # fica no banco e o email vira apenas a etiqueta do convite para o admin
+        "DROP TABLE IF EXISTS member_invites;",
+        """
+        CREATE TABLE member_invites (
+            token_hash TEXT PRIMARY KEY,
+            company_id BIGINT NOT NULL REFERENCES companies(id) ON DELETE CASCADE,
+            email TEXT NOT NULL,
+            role TEXT NOT NULL DEFAULT 'member',
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+        """,
+        # lista/contagem de convites pendentes da empresa (limite max_users)
+        "CREATE INDEX member_invites_company_idx ON member_invites (company_id, created_at);",
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def current_version(c: Connection) -> int:
+    return int(c.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_version")).scalar())
+
+def migrate(c: Connection) -> int:
+    # roda dentro da transação do chamador; o lock é liberado no COMMIT
+    c.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": MIGRATION_LOCK_KEY})
+    c.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INT PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+    """))
+
+    version = current_version(c)
+    for v, description, statements in MIGRATIONS:
+        if v <= version:
+            continue
+        for sql in statements:
+            c.execute(text(sql))
+        c.execute(text("INSERT INTO schema_version (version, description) VALUES (:v, :d)"), {"v": v, "d": description})
+        version = v
+    return version
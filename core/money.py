@@ -1,6 +1,60 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from typing import Any
+
+# dinheiro trafega como int em centavos (banco -> compute -> formatação);
+# Decimal/float só nas bordas (formulários, arquivos, colunas NUMERIC)
+Cents = int
+
+_CENT = Decimal("0.01")
+
+def to_cents(value: Any) -> Cents:
+    # reais -> centavos, arredondando meio centavo para cima (mesmo ROUND() do Postgres)
+    if isinstance(value, Decimal):
+        d = value
+    else:
+        # str(float) dá a representação curta (115.17), não o binário (115.1699999...)
+        d = Decimal(str(value).strip().replace(",", "."))
+    if not d.is_finite():
+        raise InvalidOperation(f"valor inválido: {value!r}")
+    return int(d.quantize(_CENT, rounding=ROUND_HALF_UP).scaleb(2))
+
+def from_cents(cents: Cents) -> Decimal:
+    return Decimal(int(cents)).scaleb(-2)
+
+def mul_cents(qty: Any, unit_cents: Cents) -> Cents:
+    # quantidade × preço unitário; qty fracionária (ex: metros) arredonda como o NUMERIC do banco
+    if isinstance(qty, int):
+        return qty * unit_cents
+    d = (Decimal(str(qty)) * unit_cents).quantize(Decimal(1), rounding=ROUND_HALF_UP)
+    return int(d)
+
+# grupos de milhar e centavos já formatados: brl_cents só concatena, sem replace nem format spec
+_GROUPS = tuple(f"{i:03d}" for i in range(1000))
+_CENTS = tuple(f",{i:02d}" for i in range(100))
+
+def brl_cents(cents: Cents) -> str:
+    if cents < 0:
+        prefix, cents = "R$ -", -cents
+    else:
+        prefix = "R$ "
+    reais, c = divmod(cents, 100)
+    if reais < 1000:
+        return f"{prefix}{reais}{_CENTS[c]}"
+    mil, r = divmod(reais, 1000)
+    if mil < 1000:
+        return f"{prefix}{mil}.{_GROUPS[r]}{_CENTS[c]}"
+    mi, m = divmod(mil, 1000)
+    if mi < 1000:
+        return f"{prefix}{mi}.{_GROUPS[m]}.{_GROUPS[r]}{_CENTS[c]}"
+    groups = [_GROUPS[r], _GROUPS[m]]
+    while mi >= 1000:
+        mi, g = divmod(mi, 1000)
+        groups.append(_GROUPS[g])
+    groups.append(str(mi))
+    return prefix + ".".join(reversed(groups)) + _CENTS[c]
+
 def brl(value: float) -> str:
     try:
-        v = float(value)
+        return brl_cents(to_cents(value))
     except Exception:
-        v = 0.0
-    return f"R$ {v:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+        return brl_cents(0)
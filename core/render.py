@@ -0,0 +1,113 @@
+import hashlib
+import html
+import json
+import multiprocessing
+import pathlib
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+from string import Template
+from typing import Any, Dict, Optional
+
+from core.cache import LRUCache, env_int
+from core.money import brl_cents
+
+# documento do orçamento (HTML/PDF): template compilado uma vez, render num pool de processos
+# e cache por hash do conteúdo, para downloads repetidos não renderizarem de novo
+
+TEMPLATES = pathlib.Path(__file__).resolve().parent.parent / "assets" / "templates"
+FORMATS = ("html", "pdf")
+
+try:
+    # está no requirements.txt, mas depende do Pango do sistema: sem a lib nativa o import dá OSError
+    # e o portal segue só com HTML
+    from weasyprint import HTML as _WeasyHTML
+except (ImportError, OSError):
+    _WeasyHTML = None
+
+PDF_AVAILABLE = _WeasyHTML is not None
+
+class RenderUnavailable(RuntimeError):
+    pass
+
+@lru_cache(maxsize=8)
+def _template(name: str) -> Template:
+    return Template((TEMPLATES / name).read_text(encoding="utf-8"))
+
+def _row(ln: Dict[str, Any]) -> str:
+    return (
+        f"    <tr><td>{html.escape(str(ln['desc']))}</td><td class=\"num\">{html.escape(str(ln['qty']))}</td>"
+        f"<td class=\"num\">{brl_cents(ln['unit_cents'])}</td><td class=\"num\">{brl_cents(ln['sub_cents'])}</td></tr>"
+    )
+
+def render_html(quote: Dict[str, Any], company: Dict[str, Any]) -> str:
+    created = quote.get("created_at") or datetime.now()
+    return _template("quote.html").substitute(
+        company=html.escape(company.get("company_name", "")),
+        whatsapp=html.escape(company.get("whatsapp") or "—"),
+        number=f"#{quote['id']}" if quote.get("id") else "(prévia)",
+        service=html.escape(quote.get("service_name", "")),
+        date=created.strftime("%d/%m/%Y"),
+        customer=html.escape(quote.get("customer") or ""),
+        rows="\n".join(_row(ln) for ln in quote.get("items", [])),
+        total=brl_cents(quote.get("subtotal_cents", 0)),
+    )
+
+def render_document(quote: Dict[str, Any], company: Dict[str, Any], fmt: str) -> bytes:
+    doc = render_html(quote, company)
+    if fmt == "html":
+        return doc.encode("utf-8")
+    if fmt == "pdf":
+        if _WeasyHTML is None:
+            raise RenderUnavailable("PDF indisponível: instale o pacote 'weasyprint'.")
+        return _WeasyHTML(string=doc).write_pdf()
+    raise ValueError(f"formato não suportado: {fmt}")
+
+def content_hash(quote: Dict[str, Any], company: Dict[str, Any], fmt: str) -> str:
+    payload = {
+        "fmt": fmt,
+        "quote": quote,
+        "company": {k: company.get(k) for k in ("company_name", "whatsapp")},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+# ---------- POOL ----------
+_docs = LRUCache(maxsize=env_int("RENDER_CACHE_SIZE", 128))
+_pending: Dict[str, Future] = {}
+_pool: Optional[ProcessPoolExecutor] = None
+_lock = threading.RLock()  # o callback pode rodar no próprio thread se o job já terminou
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=env_int("RENDER_WORKERS", 2), mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+def render_async(quote: Dict[str, Any], company: Dict[str, Any], fmt: str = "pdf") -> Future:
+    # Future[bytes]: já resolvido se o mesmo conteúdo foi renderizado antes
+    if fmt == "pdf" and not PDF_AVAILABLE:
+        raise RenderUnavailable("PDF indisponível: instale o pacote 'weasyprint'.")
+    h = content_hash(quote, company, fmt)
+
+    data = _docs.get(h)
+    if data is not None:
+        f: Future = Future()
+        f.set_result(data)
+        return f
+
+    with _lock:
+        # o mesmo documento pedido duas vezes enquanto renderiza reaproveita o mesmo job
+        f = _pending.get(h)
+        if f is None:
+            f = _get_pool().submit(render_document, quote, company, fmt)
+            _pending[h] = f
+
+            def done(fut: Future) -> None:
+                with _lock:
+                    _pending.pop(h, None)
+                if not fut.cancelled() and fut.exception() is None:
+                    _docs.set(h, fut.result())
+
+            f.add_done_callback(done)
+    return f
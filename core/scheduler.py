@@ -0,0 +1,130 @@
+import argparse
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from core.cache import env_float, env_int
+from core.db import invalidate_subscription, now_utc, read_conn, write_conn
+
+log = logging.getLogger(__name__)
+
+# varredura periódica do ciclo de vida da assinatura; 0 desliga a thread (use o CLI/cron)
+SWEEP_INTERVAL = env_float("SUBSCRIPTION_SWEEP_INTERVAL", 300.0)
+SWEEP_BATCH = env_int("SUBSCRIPTION_SWEEP_BATCH", 500)
+
+# (status atual, próximo status) quando current_period_end passa
+TRANSITIONS: List[Tuple[str, str]] = [
+    ("trial", "expired"),
+    ("active", "past_due"),
+]
+
+def sweep_subscriptions(engine: Engine, batch_size: int = SWEEP_BATCH, now: Optional[datetime] = None) -> Dict[str, int]:
+    # lotes pelo subscriptions_expiry_idx, um commit por lote; SKIP LOCKED deixa vários processos varrerem juntos.
+    # is_active e subscription_events são atualizados pelos triggers da tabela
+    now = now or now_utc()
+    counts: Dict[str, int] = {}
+    for old, new in TRANSITIONS:
+        done = 0
+        while True:
+            with write_conn(engine) as c:
+                rows = c.execute(text("""
+                    WITH due AS (
+                        SELECT company_id
+                        FROM subscriptions
+                        WHERE status=:old AND current_period_end <= :now
+                        ORDER BY current_period_end
+                        LIMIT :lim
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    UPDATE subscriptions s
+                    SET status=:new
+                    FROM due
+                    WHERE s.company_id = due.company_id
+                    RETURNING s.company_id
+                """), {"old": old, "new": new, "now": now, "lim": batch_size}).fetchall()
+            for r in rows:
+                invalidate_subscription(int(r[0]))
+            done += len(rows)
+            if len(rows) < batch_size:
+                break
+        counts[f"{old}->{new}"] = done
+    return counts
+
+def expiring_soon(engine: Engine, within: timedelta, limit: int = 500) -> List[Dict[str, Any]]:
+    # assinaturas vigentes que vencem na janela (range scan no mesmo índice)
+    now = now_utc()
+    with read_conn(engine) as c:
+        rows = c.execute(text("""
+            SELECT s.company_id, co.name, s.status, s.current_period_end
+            FROM subscriptions s
+            JOIN companies co ON co.id = s.company_id
+            WHERE s.status IN ('trial', 'active') AND s.current_period_end > :now AND s.current_period_end <= :until
+            ORDER BY s.current_period_end
+            LIMIT :lim
+        """), {"now": now, "until": now + within, "lim": limit}).fetchall()
+    return [{"company_id": int(r[0]), "company_name": r[1], "status": r[2], "period_end": r[3]} for r in rows]
+
+def subscription_events(engine: Engine, company_id: int, limit: int = 50) -> List[Dict[str, Any]]:
+    with read_conn(engine) as c:
+        rows = c.execute(text("""
+            SELECT from_status, to_status, period_end, at
+            FROM subscription_events
+            WHERE company_id=:cid
+            ORDER BY at DESC, id DESC
+            LIMIT :lim
+        """), {"cid": company_id, "lim": limit}).fetchall()
+    return [{"from": r[0], "to": r[1], "period_end": r[2], "at": r[3]} for r in rows]
+
+# ---------- THREAD ----------
+_thread: Optional[threading.Thread] = None
+_thread_lock = threading.Lock()
+_stop = threading.Event()
+
+def _run(engine: Engine, interval: float) -> None:
+    while not _stop.wait(interval):
+        try:
+            counts = sweep_subscriptions(engine)
+            if any(counts.values()):
+                log.info("varredura de assinaturas: %s", counts)
+        except Exception:
+            # falha de rede/banco não derruba a thread; tenta de novo no próximo ciclo
+            log.exception("varredura de assinaturas falhou")
+
+def start_scheduler(engine: Engine, interval: float = SWEEP_INTERVAL) -> bool:
+    # uma thread por processo; chamado pelo bootstrap a cada rerun, então precisa ser idempotente
+    global _thread
+    if interval <= 0:
+        return False
+    with _thread_lock:
+        if _thread is None or not _thread.is_alive():
+            _stop.clear()
+            _thread = threading.Thread(target=_run, args=(engine, interval), name="subscription-sweep", daemon=True)
+            _thread.start()
+    return True
+
+def stop_scheduler() -> None:
+    _stop.set()
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Ciclo de vida das assinaturas (para cron ou manutenção)")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    s = sub.add_parser("sweep", help="aplica as transições vencidas e sai")
+    s.add_argument("--batch", type=int, default=SWEEP_BATCH)
+    e = sub.add_parser("expiring", help="lista assinaturas que vencem nos próximos dias")
+    e.add_argument("--days", type=float, default=3.0)
+    args = ap.parse_args()
+
+    from core.bootstrap import bootstrap
+    engine = bootstrap(background=False)
+    if args.cmd == "sweep":
+        print(json.dumps(sweep_subscriptions(engine, batch_size=args.batch)))
+    else:
+        print(json.dumps(expiring_soon(engine, timedelta(days=args.days)), ensure_ascii=False, indent=2, default=str))
+
+if __name__ == "__main__":
+    main()
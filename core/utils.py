@@ -1,7 +1,13 @@
 
 import math
+import unicodedata
 
 def ceil_div(a: float, b: float) -> int:
     if b == 0:
         return 0
     return int(math.ceil(float(a) / float(b)))
+
+def fold(s: str) -> str:
+    # minúsculas sem acento, para busca ("Câmera" -> "camera", "Mão" -> "mao")
+    nfkd = unicodedata.normalize("NFKD", s or "")
+    return "".join(ch for ch in nfkd if not unicodedata.combining(ch)).lower()
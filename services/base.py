@@ -1,5 +1,19 @@
-from dataclasses import dataclass
-from typing import Callable, Dict, Any, List
+import math
+from datetime import datetime
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Any, List, Mapping, Optional, Tuple
+
+from core.db import PriceMap, resolve_prices
+
+@dataclass(frozen=True)
+class Field:
+    # entrada numérica de um serviço: alimenta o formulário e a validação headless
+    name: str
+    label: str
+    kind: type  # int ou float
+    min: Any
+    max: Any
+    default: Any
 
 @dataclass
 class ServicePlugin:
@@ -8,4 +22,68 @@ class ServicePlugin:
     module: str
     item_keys: List[str]
     render_fields: Callable[[], Dict[str, Any]]
-    compute: Callable[[Any, Dict[str, Any]], Dict[str, Any]]
+    compute: Callable[[PriceMap, Dict[str, Any]], Dict[str, Any]]
+    fields: List[Field] = field(default_factory=list)
+    # regra de agregação por item em orçamentos compostos (padrão "sum"):
+    # "max" = componente estrutural compartilhado (ex: hastes no mesmo perímetro), conta uma vez só
+    shared: Dict[str, str] = field(default_factory=dict)
+    # regra entre campos, depois dos tipos/intervalos: recebe as entradas limpas e devolve {campo: erro}
+    check: Optional[Callable[[Dict[str, Any]], Dict[str, str]]] = None
+
+SHARE_RULES = ("sum", "max")
+
+class QuoteInputError(ValueError):
+    def __init__(self, errors: Dict[str, str]):
+        super().__init__("; ".join(f"{k}: {v}" for k, v in errors.items()))
+        self.errors = errors
+
+def form_renderer(fields: List[Field]) -> Callable[[], Dict[str, Any]]:
+    def render() -> Dict[str, Any]:
+        # só a UI precisa do streamlit; importar o plugin (e o compute) continua headless
+        import streamlit as st
+        return {f.name: st.number_input(f.label, f.min, f.max, f.default) for f in fields}
+    return render
+
+def _coerce(f: Field, raw: Any) -> Any:
+    if isinstance(raw, bool) or not isinstance(raw, (int, float, str)):
+        raise ValueError("esperado um número")
+    try:
+        v = float(raw)
+    except ValueError:
+        # a mensagem do float() é em inglês e vai direto para o cliente da API
+        raise ValueError("esperado um número")
+    if not math.isfinite(v):
+        raise ValueError("esperado um número")
+    if f.kind is int:
+        if v != int(v):
+            raise ValueError("esperado um inteiro")
+        v = int(v)
+    if v < f.min or v > f.max:
+        raise ValueError(f"fora do intervalo {f.min}–{f.max}")
+    return v
+
+def validate_inputs(plugin: ServicePlugin, raw: Mapping[str, Any]) -> Dict[str, Any]:
+    # campos ausentes usam o default do formulário; campos desconhecidos são erro
+    errors = {k: "campo desconhecido" for k in raw if k not in {f.name for f in plugin.fields}}
+    clean = {}
+    for f in plugin.fields:
+        try:
+            clean[f.name] = _coerce(f, raw.get(f.name, f.default))
+        except ValueError as e:
+            errors[f.name] = str(e)
+    if not errors and plugin.check is not None:
+        errors = plugin.check(clean)
+    if errors:
+        raise QuoteInputError(errors)
+    return clean
+
+def collect_item_keys(plugins: List[ServicePlugin]) -> List[str]:
+    keys = set()
+    for p in plugins:
+        keys.update(p.item_keys)
+    return sorted(keys)
+
+def compute_services(engine, company_id: int, selections: List[Tuple[ServicePlugin, Dict[str, Any]]], at: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    # um único round-trip de preços para todos os serviços do orçamento (at: preços vigentes naquele instante)
+    prices = resolve_prices(engine, company_id, collect_item_keys([p for p, _ in selections]), at=at)
+    return [p.compute(prices, inputs) for p, inputs in selections]
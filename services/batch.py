@@ -0,0 +1,46 @@
+from typing import Any, Dict, List, Mapping, Sequence, Union
+
+import numpy as np
+
+from core.db import PriceMap
+
+# orçamento em lote: N cenários de cerca/concertina num único passe vetorizado.
+# Quantidades com a mesma aritmética float64 do compute escalar e totais em centavos
+# (int64), então os resultados batem exatamente com services.fence / services.concertina_linear.
+
+Scenarios = Union[Sequence[Mapping[str, Any]], Mapping[str, Sequence[Any]]]
+
+def _columns(scenarios: Scenarios, fields: Dict[str, Any]) -> List[np.ndarray]:
+    # aceita lista de dicts (mesmo formato do compute) ou dict de colunas
+    if isinstance(scenarios, Mapping):
+        return [np.asarray(scenarios[f], dtype=dt) for f, dt in fields.items()]
+    return [np.fromiter((s[f] for s in scenarios), dtype=dt, count=len(scenarios)) for f, dt in fields.items()]
+
+def ceil_div(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    # versão vetorizada de core.utils.ceil_div (divisor 0 -> 0)
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    out = np.zeros(np.broadcast(a, b).shape, dtype=np.int64)
+    nz = np.broadcast_to(b != 0, out.shape)
+    a, b = np.broadcast_arrays(a, b)
+    out[nz] = np.ceil(a[nz] / b[nz])
+    return out
+
+def fence_batch(prices: PriceMap, scenarios: Scenarios) -> Dict[str, np.ndarray]:
+    per, espac, cantos = _columns(scenarios, {"perimetro": np.float64, "espac": np.float64, "cantos": np.int64})
+
+    vaos = ceil_div(per, espac)
+    retas = vaos + 1 - cantos
+    subtotal = retas * prices["haste_reta"] + cantos * prices["haste_canto"]
+
+    return {"vaos": vaos, "retas": retas, "cantos": cantos, "subtotal_cents": subtotal}
+
+def concertina_batch(prices: PriceMap, scenarios: Scenarios) -> Dict[str, np.ndarray]:
+    per, fios, espac, cantos = _columns(scenarios, {"per": np.float64, "fios": np.int64, "espac": np.float64, "cantos": np.int64})
+
+    vaos = ceil_div(per, espac)
+    retas = vaos + 1 - cantos
+    rolos = ceil_div(per * fios, 20)
+    subtotal = retas * prices["haste_reta"] + cantos * prices["haste_canto"] + rolos * prices["concertina_linear_20m"]
+
+    return {"vaos": vaos, "retas": retas, "cantos": cantos, "rolos": rolos, "subtotal_cents": subtotal}
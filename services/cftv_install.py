@@ -1,8 +1,5 @@
-from datetime import datetime
-import streamlit as st
-from core.db import get_price
-from core.money import brl
-from services.base import ServicePlugin
+from core.money import brl_cents, mul_cents
+from services.base import Field, ServicePlugin, form_renderer
 
 id = "cftv_install"
 label = "CFTV - Instalação"
@@ -14,31 +11,32 @@ item_keys = [
     "mao_cftv_por_camera"
 ]
 
-def render_fields():
-    qtd = st.number_input("Quantidade de câmeras", 1, 32, 4)
-    return {"qtd": qtd}
+fields = [
+    Field("qtd", "Quantidade de câmeras", int, 1, 32, 4),
+]
+
+render_fields = form_renderer(fields)
 
-def compute(conn, inputs):
+def compute(prices, inputs):
     qtd = inputs["qtd"]
     items = []
     subtotal = 0
 
-    def add(desc, qty, unit):
+    def add(key, desc, qty, unit_cents):
         nonlocal subtotal
-        sub = qty * unit
-        items.append({"desc": desc, "qty": qty, "unit": unit, "sub": sub})
+        sub = mul_cents(qty, unit_cents)
+        items.append({"key": key, "desc": desc, "qty": qty, "unit_cents": unit_cents, "sub_cents": sub})
         subtotal += sub
 
-    add("Câmera", qtd, get_price(conn, "cftv_camera"))
-    add("Mão de obra por câmera", qtd, get_price(conn, "mao_cftv_por_camera"))
+    add("cftv_camera", "Câmera", qtd, prices["cftv_camera"])
+    add("mao_cftv_por_camera", "Mão de obra por câmera", qtd, prices["mao_cftv_por_camera"])
 
     return {
-        "id": str(datetime.now().timestamp()),
         "service_id": id,
         "service_name": label,
         "items": items,
-        "subtotal": subtotal,
-        "subtotal_brl": brl(subtotal),
+        "subtotal_cents": subtotal,
+        "subtotal_brl": brl_cents(subtotal),
     }
 
-plugin = ServicePlugin(id, label, module, item_keys, render_fields, compute)
+plugin = ServicePlugin(id, label, module, item_keys, render_fields, compute, fields)
@@ -0,0 +1,222 @@
+import copy
+import json
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, Hashable, List, Mapping, Optional, Tuple
+
+from core.cache import LRUCache, env_int
+from core.db import catalog_version, list_items, resolve_prices
+from core.money import brl_cents, mul_cents
+from services.base import QuoteInputError, compute_services, validate_inputs
+from services.optimizer import plan_run
+from services.registry import PluginLoadError, SERVICE_REGISTRY
+
+# motor de orçamento headless: sem streamlit, usado pelo app, pela API e por jobs em lote
+
+CFTV_DYNAMIC_ID = "cftv_dinamico"
+CFTV_DYNAMIC_LABEL = "CFTV (dinâmico)"
+
+# orçamentos memorizados por (empresa, serviço, entradas canônicas, versão do catálogo, data dos preços).
+# A versão muda a cada escrita em items, então um preço alterado nunca serve resultado antigo.
+_quote_cache = LRUCache(maxsize=env_int("QUOTE_CACHE_SIZE", 2048))
+_quote_stats = {"hits": 0, "misses": 0}
+_quote_stats_lock = threading.Lock()
+
+def _count(hits: int, misses: int) -> None:
+    with _quote_stats_lock:
+        _quote_stats["hits"] += hits
+        _quote_stats["misses"] += misses
+
+def _canonical(inputs: Mapping[str, Any]) -> str:
+    return json.dumps(inputs, sort_keys=True, separators=(",", ":"), default=str)
+
+def quote_cache_stats() -> Dict[str, Any]:
+    with _quote_stats_lock:
+        stats = dict(_quote_stats)
+    total = stats["hits"] + stats["misses"]
+    return {**stats, "size": len(_quote_cache), "hit_rate": stats["hits"] / total if total else 0.0}
+
+def clear_quote_cache() -> None:
+    _quote_cache.clear()
+
+def _memo(key: Hashable, build: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+    hit = _quote_cache.get(key)
+    if hit is not None:
+        _count(1, 0)
+        return copy.deepcopy(hit)
+    _count(0, 1)
+    result = build()
+    _quote_cache.set(key, copy.deepcopy(result))
+    return result
+
+def _plugin(service_id: str):
+    try:
+        return SERVICE_REGISTRY[service_id]
+    except KeyError:
+        raise QuoteInputError({"service_id": f"serviço desconhecido: {service_id}"})
+    except PluginLoadError as e:
+        raise QuoteInputError({"service_id": str(e)})
+
+def quote_many(engine, company_id: int, requests: List[Tuple[str, Mapping[str, Any]]], at: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    # valida tudo antes de tocar no banco; os preços saem numa única consulta
+    selections = []
+    errors: Dict[str, str] = {}
+    for i, (service_id, raw) in enumerate(requests):
+        try:
+            plugin = _plugin(service_id)
+            selections.append((plugin, validate_inputs(plugin, raw)))
+        except QuoteInputError as e:
+            errors.update({f"{i}.{k}": v for k, v in e.errors.items()})
+    if errors:
+        raise QuoteInputError(errors)
+
+    # versão lida do banco (sem o cache da busca) antes dos preços: o resultado guardado nunca é mais
+    # velho que a versão da chave, e uma mudança de preço em outro processo vale já na próxima chamada
+    version = catalog_version(engine, company_id)
+    keys = [(company_id, p.id, _canonical(inputs), version, at) for p, inputs in selections]
+    results: List[Optional[Dict[str, Any]]] = [_quote_cache.get(k) for k in keys]
+    misses = [i for i, r in enumerate(results) if r is None]
+    _count(len(keys) - len(misses), len(misses))
+
+    if misses:
+        # só os serviços que faltam vão ao banco, ainda numa única consulta de preços
+        computed = compute_services(engine, company_id, [selections[i] for i in misses], at=at)
+        for i, r in zip(misses, computed):
+            _quote_cache.set(keys[i], r)
+            results[i] = r
+    return [copy.deepcopy(r) for r in results]
+
+def quote(engine, company_id: int, service_id: str, inputs: Mapping[str, Any], at: Optional[datetime] = None) -> Dict[str, Any]:
+    # at: recalcula com os preços vigentes naquela data (ex: reabrir um orçamento antigo)
+    try:
+        return quote_many(engine, company_id, [(service_id, inputs)], at=at)[0]
+    except QuoteInputError as e:
+        raise QuoteInputError({k.partition(".")[2]: v for k, v in e.errors.items()})
+
+def composite_quote(engine, company_id: int, requests: List[Tuple[str, Mapping[str, Any]]], at: Optional[datetime] = None) -> Dict[str, Any]:
+    # vários serviços no mesmo trabalho: uma lista de materiais consolidada por item
+    quotes = quote_many(engine, company_id, requests, at=at)
+    rules: Dict[str, str] = {}
+    for service_id, _ in requests:
+        for key, rule in _plugin(service_id).shared.items():
+            # se algum serviço declara o item como compartilhado, vale "max"
+            if rule == "max" or key not in rules:
+                rules[key] = rule
+
+    merged: Dict[str, Dict[str, Any]] = {}
+    for q in quotes:
+        for ln in q["items"]:
+            key = ln["key"] or ln["desc"]
+            cur = merged.get(key)
+            if cur is None:
+                merged[key] = {**ln, "services": [q["service_id"]]}
+                continue
+            cur["services"].append(q["service_id"])
+            if rules.get(key, "sum") == "max":
+                cur["qty"] = max(cur["qty"], ln["qty"])
+            else:
+                cur["qty"] += ln["qty"]
+
+    items = []
+    subtotal = 0
+    for ln in merged.values():
+        ln["sub_cents"] = mul_cents(ln["qty"], ln["unit_cents"])
+        subtotal += ln["sub_cents"]
+        items.append(ln)
+
+    return {
+        "service_id": "+".join(q["service_id"] for q in quotes),
+        "service_name": " + ".join(q["service_name"] for q in quotes),
+        "items": items,
+        "services": quotes,
+        "subtotal_cents": subtotal,
+        "subtotal_brl": brl_cents(subtotal),
+    }
+
+def cftv_dynamic(engine, company_id: int, quantities: Mapping[str, int]) -> Dict[str, Any]:
+    # uma leitura da versão serve à chave do memo e ao catálogo: o valor guardado é o daquela versão
+    version = catalog_version(engine, company_id)
+    key = (company_id, CFTV_DYNAMIC_ID, _canonical(quantities), version, None)
+    return _memo(key, lambda: _cftv_dynamic(engine, company_id, quantities, version))
+
+def _cftv_dynamic(engine, company_id: int, quantities: Mapping[str, int], version: Optional[int] = None) -> Dict[str, Any]:
+    # câmeras do catálogo (categoria cftv_camera) × quantidade + mão de obra por câmera
+    cams = {c["key"]: c for c in list_items(engine, company_id, module="seguranca", category="cftv_camera", version=version)}
+    errors = {}
+    for key, qty in quantities.items():
+        if key not in cams:
+            errors[key] = "câmera não cadastrada"
+        elif isinstance(qty, bool) or not isinstance(qty, int) or qty < 0:
+            errors[key] = "quantidade deve ser um inteiro >= 0"
+    if errors:
+        raise QuoteInputError(errors)
+
+    items = []
+    total_cameras = 0
+    materials = 0
+    for key, qty in quantities.items():
+        if qty <= 0:
+            continue
+        cam = cams[key]
+        sub = mul_cents(qty, cam["price_cents"])
+        items.append({"key": key, "desc": cam["name"], "qty": qty, "unit_cents": cam["price_cents"], "sub_cents": sub})
+        total_cameras += qty
+        materials += sub
+
+    mao = list_items(engine, company_id, module="seguranca", category="mao_obra", search="por câmera", version=version)
+    mao_unit = mao[0]["price_cents"] if mao else 0
+    labor = mul_cents(total_cameras, mao_unit)
+    items.append({"key": mao[0]["key"] if mao else "", "desc": "Mão de obra por câmera", "qty": total_cameras,
+                  "unit_cents": mao_unit, "sub_cents": labor})
+
+    return {
+        "service_id": CFTV_DYNAMIC_ID,
+        "service_name": CFTV_DYNAMIC_LABEL,
+        "items": items,
+        "total_cameras": total_cameras,
+        "materials_cents": materials,
+        "labor_cents": labor,
+        "subtotal_cents": materials + labor,
+        "subtotal_brl": brl_cents(materials + labor),
+    }
+
+CONCERTINA_PLAN_ID = "concertina_plano"
+CONCERTINA_PLAN_LABEL = "Concertina linear (plano de corte por trecho)"
+MAX_SEGMENTS = 2000
+
+def concertina_plan(engine, company_id: int, segments: Any, fios: Any = 6, espac: Any = 2.5, closed: bool = True) -> Dict[str, Any]:
+    # mesmo material do plugin concertina_linear, mas com rolos e hastes calculados trecho a trecho
+    errors = {}
+    if not isinstance(segments, list) or not segments or len(segments) > MAX_SEGMENTS:
+        errors["segments"] = f"esperado uma lista de 1 a {MAX_SEGMENTS} comprimentos (m)"
+    elif any(isinstance(s, bool) or not isinstance(s, (int, float)) or not 0 < s <= 10_000 for s in segments):
+        errors["segments"] = "cada trecho deve ser um número entre 0 e 10000 m"
+    if isinstance(fios, bool) or not isinstance(fios, int) or not 1 <= fios <= 10:
+        errors["fios"] = "inteiro entre 1 e 10"
+    if isinstance(espac, bool) or not isinstance(espac, (int, float)) or not 0.5 <= espac <= 5.0:
+        errors["espac"] = "número entre 0.5 e 5.0"
+    if errors:
+        raise QuoteInputError(errors)
+
+    plan = plan_run([float(s) for s in segments], fios, float(espac), closed=bool(closed))
+    prices = resolve_prices(engine, company_id, ["haste_reta", "haste_canto", "concertina_linear_20m"])
+
+    items = []
+    subtotal = 0
+    for key, desc, qty in (
+        ("haste_reta", "Haste reta", plan["posts"]["retas"]),
+        ("haste_canto", "Haste de canto", plan["posts"]["cantos"]),
+        ("concertina_linear_20m", "Concertina linear (20m)", plan["rolls"]),
+    ):
+        sub = mul_cents(qty, prices[key])
+        items.append({"key": key, "desc": desc, "qty": qty, "unit_cents": prices[key], "sub_cents": sub})
+        subtotal += sub
+
+    return {
+        "service_id": CONCERTINA_PLAN_ID,
+        "service_name": CONCERTINA_PLAN_LABEL,
+        "items": items,
+        "subtotal_cents": subtotal,
+        "subtotal_brl": brl_cents(subtotal),
+        "plan": plan,
+    }
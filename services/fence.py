@@ -1,8 +1,5 @@
-from datetime import datetime
-import streamlit as st
-from core.db import get_price
-from core.money import brl
-from services.base import ServicePlugin
+from core.money import brl_cents, mul_cents
+from services.base import Field, ServicePlugin, form_renderer
 from core.utils import ceil_div
 
 id = "cerca"
@@ -14,13 +11,28 @@ item_keys = [
     "haste_canto"
 ]
 
-def render_fields():
-    perimetro = st.number_input("Perímetro (m)", 1.0, 500.0, 36.0)
-    espac = st.number_input("Espaçamento (m)", 0.5, 5.0, 2.5)
-    cantos = st.number_input("Cantos", 1, 20, 4)
-    return {"perimetro": perimetro, "espac": espac, "cantos": cantos}
+fields = [
+    Field("perimetro", "Perímetro (m)", float, 1.0, 500.0, 36.0),
+    Field("espac", "Espaçamento (m)", float, 0.5, 5.0, 2.5),
+    Field("cantos", "Cantos", int, 1, 20, 4),
+]
+
+render_fields = form_renderer(fields)
+
+# cerca e concertina no mesmo muro usam as mesmas hastes
+shared = {
+    "haste_reta": "max",
+    "haste_canto": "max",
+}
+
+def check(inputs):
+    # cada canto ocupa uma das vaos + 1 hastes; mais cantos que hastes daria qtd negativa de retas
+    hastes = ceil_div(inputs["perimetro"], inputs["espac"]) + 1
+    if inputs["cantos"] > hastes:
+        return {"cantos": f"no máximo {hastes} para esse perímetro e espaçamento"}
+    return {}
 
-def compute(conn, inputs):
+def compute(prices, inputs):
     per = inputs["perimetro"]
     espac = inputs["espac"]
     cantos = inputs["cantos"]
@@ -32,22 +44,21 @@ def compute(conn, inputs):
     items = []
     subtotal = 0
 
-    def add(desc, qty, unit):
+    def add(key, desc, qty, unit_cents):
         nonlocal subtotal
-        sub = qty * unit
-        items.append({"desc": desc, "qty": qty, "unit": unit, "sub": sub})
+        sub = mul_cents(qty, unit_cents)
+        items.append({"key": key, "desc": desc, "qty": qty, "unit_cents": unit_cents, "sub_cents": sub})
         subtotal += sub
 
-    add("Haste reta", retas, get_price(conn, "haste_reta"))
-    add("Haste de canto", cantos, get_price(conn, "haste_canto"))
+    add("haste_reta", "Haste reta", retas, prices["haste_reta"])
+    add("haste_canto", "Haste de canto", cantos, prices["haste_canto"])
 
     return {
-        "id": str(datetime.now().timestamp()),
         "service_id": id,
         "service_name": label,
         "items": items,
-        "subtotal": subtotal,
-        "subtotal_brl": brl(subtotal),
+        "subtotal_cents": subtotal,
+        "subtotal_brl": brl_cents(subtotal),
     }
 
-plugin = ServicePlugin(id, label, module, item_keys, render_fields, compute)
+plugin = ServicePlugin(id, label, module, item_keys, render_fields, compute, fields, shared, check)
@@ -0,0 +1,165 @@
+import math
+from bisect import bisect_left, insort
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from core.cache import env_int
+
+# plano de corte de concertina/cerca por trecho de muro.
+# O compute dos plugins trata o perímetro como um fio contínuo (ceil(per × fios / 20)); aqui cada
+# trecho entre cantos vira `fios` pedaços, trechos > rolo viram rolos inteiros + resto, e os restos
+# são empacotados em rolos de 20 m (best-fit decreasing; exato por branch and bound se couber).
+# Comprimentos em centímetros inteiros para o empacotamento não depender de arredondamento float.
+
+ROLL_M = 20.0
+# até quantos pedaços (fora os rolos inteiros) o solver exato é tentado
+EXACT_MAX_PIECES = env_int("OPTIMIZER_EXACT_MAX", 16)
+# limite de nós do branch and bound; estourou, fica a heurística
+EXACT_MAX_NODES = env_int("OPTIMIZER_EXACT_NODES", 20_000)
+
+Piece = Tuple[int, int]  # (comprimento em cm, índice do trecho)
+
+def _cm(m: float) -> int:
+    return int(math.ceil(round(m * 100, 6)))
+
+def _best_fit_decreasing(pieces: List[Piece], cap: int) -> List[List[Piece]]:
+    # capacidades livres ordenadas: cada pedaço vai no rolo mais cheio que ainda o comporta (O(n log n))
+    pieces = sorted(pieces, reverse=True)
+    rolls: List[List[Piece]] = []
+    free: List[Tuple[int, int]] = []  # (cm livres, índice do rolo)
+    for p in pieces:
+        i = bisect_left(free, (p[0], -1))
+        if i < len(free):
+            left, r = free.pop(i)
+        else:
+            left, r = cap, len(rolls)
+            rolls.append([])
+        rolls[r].append(p)
+        if left - p[0] > 0:
+            insort(free, (left - p[0], r))
+    return rolls
+
+def _exact(pieces: List[Piece], cap: int, upper: int) -> Optional[List[List[Piece]]]:
+    # menor número de rolos; None se não melhora `upper` ou se estourou o limite de nós
+    pieces = sorted(pieces, reverse=True)
+    total = sum(p[0] for p in pieces)
+    lower = -(-total // cap)
+    if lower >= upper:
+        return None
+
+    suffix = [0] * (len(pieces) + 1)
+    for i in range(len(pieces) - 1, -1, -1):
+        suffix[i] = suffix[i + 1] + pieces[i][0]
+
+    best: List[Optional[List[List[Piece]]]] = [None]
+    best_n = [upper]
+    nodes = [0]
+    bins: List[List[Piece]] = []
+    free: List[int] = []
+
+    def dfs(i: int) -> bool:
+        nodes[0] += 1
+        if nodes[0] > EXACT_MAX_NODES:
+            return True
+        if i == len(pieces):
+            best_n[0] = len(bins)
+            best[0] = [list(b) for b in bins]
+            return best_n[0] == lower
+        # o que sobra e não cabe nos rolos abertos exige rolos novos
+        need = -(-max(0, suffix[i] - sum(free)) // cap)
+        if len(bins) + need >= best_n[0]:
+            return False
+        p = pieces[i]
+        tried = set()
+        for b in range(len(bins)):
+            if free[b] >= p[0] and free[b] not in tried:
+                tried.add(free[b])
+                bins[b].append(p)
+                free[b] -= p[0]
+                stop = dfs(i + 1)
+                free[b] += p[0]
+                bins[b].pop()
+                if stop:
+                    return True
+        if len(bins) + 1 < best_n[0]:
+            bins.append([p])
+            free.append(cap - p[0])
+            stop = dfs(i + 1)
+            bins.pop()
+            free.pop()
+            if stop:
+                return True
+        return False
+
+    dfs(0)
+    return best[0]
+
+def place_posts(segments: Sequence[float], espac: float, closed: bool = True) -> Dict[str, Any]:
+    # hastes de canto nos vértices (num trecho aberto, também nas duas pontas);
+    # retas igualmente espaçadas dentro de cada trecho, sem passar de `espac`
+    plan = []
+    retas = 0
+    for i, length in enumerate(segments):
+        vaos = max(1, math.ceil(round(length / espac, 9)))
+        step = length / vaos
+        positions = [round(step * k, 2) for k in range(1, vaos)]
+        retas += len(positions)
+        plan.append({"segment": i, "length": length, "spacing": round(step, 3), "positions": positions})
+    cantos = len(segments) if closed else len(segments) + 1
+    return {"retas": retas, "cantos": cantos, "segments": plan}
+
+def pack_runs(segments: Sequence[float], fios: int, roll_m: float = ROLL_M, exact: bool = True) -> Dict[str, Any]:
+    cap = _cm(roll_m)
+    full: List[Dict[str, int]] = []
+    pieces: List[Piece] = []
+    for i, length in enumerate(segments):
+        whole, rest = divmod(_cm(length), cap)
+        if whole:
+            # rolos inteiros esticados direto no trecho, sem corte
+            full.append({"segment": i, "rolls": whole * fios})
+        if rest:
+            pieces.extend([(rest, i)] * fios)
+
+    rolls = _best_fit_decreasing(pieces, cap)
+    method = "best_fit_decreasing"
+    if exact and 0 < len(pieces) <= EXACT_MAX_PIECES:
+        better = _exact(pieces, cap, len(rolls))
+        if better is not None:
+            rolls, method = better, "exact"
+
+    waste = 0
+    plans = []
+    for roll in rolls:
+        left = cap - sum(p[0] for p in roll)
+        waste += left
+        plans.append({"cuts": [{"segment": s, "length_m": cm / 100} for cm, s in roll], "waste_m": left / 100})
+    patterns = Counter(tuple(cm / 100 for cm, _ in roll) for roll in rolls)
+    return {
+        "rolls": sum(f["rolls"] for f in full) + len(rolls),
+        "method": method,
+        "waste_m": waste / 100,
+        "full_rolls": full,
+        "cut_plan": plans,
+        "patterns": [{"cuts_m": list(k), "rolls": n} for k, n in patterns.most_common()],
+    }
+
+def plan_run(segments: Sequence[float], fios: int, espac: float, closed: bool = True,
+             roll_m: float = ROLL_M, exact: bool = True) -> Dict[str, Any]:
+    # trechos em metros, na ordem do muro; closed=True fecha o perímetro (último trecho encontra o primeiro)
+    if not segments:
+        raise ValueError("informe ao menos um trecho")
+    if any(not (s > 0) or math.isinf(s) for s in segments):
+        raise ValueError("trechos devem ter comprimento positivo")
+    if fios < 0 or espac <= 0 or roll_m <= 0:
+        raise ValueError("fios >= 0, espaçamento e rolo > 0")
+    posts = place_posts(segments, espac, closed=closed)
+    runs = pack_runs(segments, fios, roll_m=roll_m, exact=exact) if fios else {
+        "rolls": 0, "method": "none", "waste_m": 0.0, "full_rolls": [], "cut_plan": [], "patterns": []}
+    per = sum(segments)
+    return {
+        "perimeter_m": round(per, 2),
+        # referência: fórmula atual dos plugins para o mesmo perímetro
+        "formula_rolls": math.ceil(per * fios / roll_m),
+        **runs,
+        "posts": posts,
+    }
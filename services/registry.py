@@ -1,9 +1,88 @@
-from services.cftv_install import plugin as cftv_install
-from services.fence import plugin as fence
-from services.concertina_linear import plugin as concertina_linear
-
-SERVICE_REGISTRY = {
-    cftv_install.id: cftv_install,
-    fence.id: fence,
-    concertina_linear.id: concertina_linear,
-}
+import importlib
+import logging
+import threading
+from importlib.metadata import entry_points
+from typing import Dict, Iterator, List, Mapping, NamedTuple, Optional
+
+from services.base import ServicePlugin
+
+log = logging.getLogger(__name__)
+
+class PluginSpec(NamedTuple):
+    id: str
+    label: str
+    target: str  # "pacote.modulo:atributo"
+
+# manifesto dos serviços embutidos: listar não importa nada, o módulo carrega no 1º uso
+MANIFEST: List[PluginSpec] = [
+    PluginSpec("cftv_install", "CFTV - Instalação", "services.cftv_install:plugin"),
+    PluginSpec("cerca", "Cerca elétrica", "services.fence:plugin"),
+    PluginSpec("concertina_linear", "Concertina linear eletrificada", "services.concertina_linear:plugin"),
+]
+
+# pacotes externos podem registrar serviços via entry points neste grupo
+ENTRY_POINT_GROUP = "orcamento_portal.services"
+
+class PluginLoadError(ImportError):
+    pass
+
+class LazyRegistry(Mapping[str, ServicePlugin]):
+    def __init__(self, manifest: List[PluginSpec], group: Optional[str] = None):
+        self._manifest = list(manifest)
+        self._group = group
+        self._specs: Optional[Dict[str, PluginSpec]] = None
+        self._loaded: Dict[str, ServicePlugin] = {}
+        self._errors: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def specs(self) -> Dict[str, PluginSpec]:
+        if self._specs is None:
+            specs = {s.id: s for s in self._manifest}
+            if self._group:
+                for ep in entry_points(group=self._group):
+                    specs.setdefault(ep.name, PluginSpec(ep.name, ep.name, ep.value))
+            self._specs = specs
+        return self._specs
+
+    def labels(self) -> Dict[str, str]:
+        return {sid: s.label for sid, s in self.specs().items()}
+
+    def errors(self) -> Dict[str, str]:
+        return dict(self._errors)
+
+    def _load(self, spec: PluginSpec) -> ServicePlugin:
+        mod_name, _, attr = spec.target.partition(":")
+        obj = getattr(importlib.import_module(mod_name), attr or "plugin")
+        if not isinstance(obj, ServicePlugin) or obj.id != spec.id:
+            raise TypeError(f"{spec.target} não é o ServicePlugin '{spec.id}'")
+        return obj
+
+    def __getitem__(self, service_id: str) -> ServicePlugin:
+        plugin = self._loaded.get(service_id)
+        if plugin is not None:
+            return plugin
+
+        spec = self.specs()[service_id]
+        with self._lock:
+            if service_id in self._loaded:
+                return self._loaded[service_id]
+            if service_id in self._errors:
+                raise PluginLoadError(self._errors[service_id])
+            try:
+                plugin = self._load(spec)
+            except Exception as e:
+                # falha isolada: só este serviço fica indisponível
+                msg = f"Serviço '{service_id}' indisponível: {e}"
+                log.exception(msg)
+                self._errors[service_id] = msg
+                raise PluginLoadError(msg) from e
+            self._loaded[service_id] = plugin
+            return plugin
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.specs())
+
+    def __len__(self) -> int:
+        return len(self.specs())
+
+SERVICE_REGISTRY = LazyRegistry(MANIFEST, group=ENTRY_POINT_GROUP)
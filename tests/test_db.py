@@ -0,0 +1,42 @@
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from sqlalchemy import create_engine, text
+
+from core.db import read_conn, unit_of_work, write_conn
+
+@pytest.fixture
+def engine():
+    # SQLite em memória: um banco por conexão do SingletonThreadPool, o suficiente para o ciclo de conexões
+    e = create_engine("sqlite://")
+    with write_conn(e) as c:
+        c.execute(text("CREATE TABLE t (x INTEGER)"))
+    yield e
+    e.dispose()
+
+def count(engine) -> int:
+    with read_conn(engine) as c:
+        return c.execute(text("SELECT count(*) FROM t")).scalar()
+
+def test_read_then_write_inside_unit_of_work(engine):
+    with unit_of_work(engine) as uow:
+        assert count(engine) == 0
+        with write_conn(engine) as c:
+            assert c is uow
+            c.execute(text("INSERT INTO t VALUES (1)"))
+        assert count(engine) == 1
+        with write_conn(engine) as c:
+            c.execute(text("INSERT INTO t VALUES (2)"))
+    assert count(engine) == 2
+
+def test_failed_write_rolls_back_and_unit_of_work_continues(engine):
+    with unit_of_work(engine):
+        with pytest.raises(RuntimeError):
+            with write_conn(engine) as c:
+                c.execute(text("INSERT INTO t VALUES (1)"))
+                raise RuntimeError("falha no meio da escrita")
+        assert count(engine) == 0
+        with write_conn(engine) as c:
+            c.execute(text("INSERT INTO t VALUES (2)"))
+    assert count(engine) == 1